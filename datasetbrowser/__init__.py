@@ -9,7 +9,17 @@ from pyramid.config import Configurator
 from pyramid.static import static_view
 from sqlalchemy import engine_from_config
 
+from datasetbrowser.requesthandler.diskCache import DiskCache
+from datasetbrowser.requesthandler.cacheHandler import LRUCache, cache_directory
+from datasetbrowser.requesthandler.csvColumnStore import CSVColumnStore
+from datasetbrowser.requesthandler.csvRowIndex import CSVRowIndex
+from datasetbrowser.requesthandler.descriptionHandler import DirectoryDescriptionStore
 from datasetbrowser.requesthandler.directorySettingsHandler import DirectoryLoadSettings
+from datasetbrowser.requesthandler.reportJobs import ReportJobQueue
+from datasetbrowser.requesthandler.thumbnailHandler import ThumbnailHandler
+from datasetbrowser.requesthandler.settingsWatcher import SettingsWatcher
+from datasetbrowser.requesthandler.workerPool import WorkerPool
+from datasetbrowser.templateHandler import TemplateHandler
 from models import initialize_sql
 from usermanagement.security import PythonUserManager, FileBasedUserManager
 
@@ -61,6 +71,9 @@ def load_database_settings(settings):
 def main(global_config, **settings):
     settings = load_usermanager(settings)
     settings = load_database_settings(settings)
+    # the worker processes are forked before any thread of the application or the server is started
+    WorkerPool.configure(settings)
+    WorkerPool.get()
 
     secrethash = settings['secret'] if 'secret' in settings else 'sosecret'
     authn_policy = AuthTktAuthenticationPolicy(secrethash, callback=settings['usermanager'].groupfinder,
@@ -70,6 +83,39 @@ def main(global_config, **settings):
     config.set_authentication_policy(authn_policy)
     config.set_authorization_policy(authz_policy)
     config.registry.settings['directory_settings'] = dict()
+    config.registry.settings['directory_page_cache'] = LRUCache(
+        int(settings.get('directory_cache.max_entries', 64)))
+    config.registry.settings['directory_grouping_cache'] = LRUCache(
+        int(settings.get('directory_cache.max_entries', 64)))
+    config.registry.settings['description_store'] = DirectoryDescriptionStore()
+    config.registry.settings['rendered_fragment_cache'] = LRUCache(
+        int(settings.get('fragment_cache.max_entries', 1024)),
+        int(settings.get('fragment_cache.max_bytes', 64 * 1024 ** 2)))
+    archive_cache_bytes = int(settings.get('archive_cache.max_bytes', 10 * 1024 ** 3))
+    if archive_cache_bytes > 0:
+        config.registry.settings['archive_cache'] = DiskCache(cache_directory(settings, 'archives'),
+                                                              archive_cache_bytes)
+    if config.registry.settings.get('reload_templates', False):
+        config.registry.settings['settings_watcher'] = SettingsWatcher(
+            config.registry.settings['directory_settings'], float(settings.get('settings.poll_interval', 1.0)))
+    config.registry.settings['report_jobs'] = ReportJobQueue(
+        DiskCache(cache_directory(settings, 'reports'), int(settings.get('report_cache.max_bytes', 1024 ** 3)),
+                  suffix='.pdf'),
+        int(settings.get('report.workers', 2)))
+    config.registry.settings['thumbnails'] = ThumbnailHandler(
+        DiskCache(cache_directory(settings, 'thumbnails'),
+                  int(settings.get('thumbnail_cache.max_bytes', 1024 ** 3)), suffix='.png'))
+    config.registry.settings['contact_sheets'] = DiskCache(
+        cache_directory(settings, 'contact_sheets'), int(settings.get('contact_sheet_cache.max_bytes', 1024 ** 3)),
+        suffix='.png')
+    config.registry.settings['csv_row_index'] = CSVRowIndex(
+        DiskCache(cache_directory(settings, 'csv_index'), int(settings.get('csv_index_cache.max_bytes', 1024 ** 3)),
+                  suffix='.npy'))
+    csv_columns_bytes = int(settings.get('csv_columns_cache.max_bytes', 10 * 1024 ** 3))
+    if csv_columns_bytes > 0:
+        config.registry.settings['csv_column_store'] = CSVColumnStore(
+            DiskCache(cache_directory(settings, 'csv_columns'), csv_columns_bytes, suffix='.npy'))
+    TemplateHandler.configure(settings)
 
     log.info('Engine from config')
     config.scan('models')
@@ -91,6 +137,7 @@ def main(global_config, **settings):
 
     fileroutes = [dict(route_name='markdown', file_extension='\.md', options=None),
                   dict(route_name='csv', file_extension='\.csv', options=None),
+                  dict(route_name='csv_stats', file_extension='\.csv', options='/stats'),
                   dict(route_name='csv_delimiter', file_extension='\.csv', options='/{delimiter}'),
                   dict(route_name='matlab', file_extension='\.m', options=None),
                   dict(route_name='matlabfileviewer', file_extension='\.mat', options=None),
@@ -105,18 +152,21 @@ def main(global_config, **settings):
 
     config.add_route('directory', '/{dir:' + dir_path + '}')
     config.add_route('static', '/_static/*subpath')
+    config.add_route('thumbnail', '/_thumb/{size}/*subpath', permission='authenticatedusers')
+    config.add_route('report_job', '/_jobs/{jobid}', permission='authenticatedusers')
+    config.add_route('report_job_result', '/_jobs/{jobid}/result', permission='authenticatedusers')
     config.add_route('files_comment', '/{file:' + dir_path + file_basename + '}/{action:comment}', permission='authenticatedusers')
     config.add_route('files', '/*subpath', permission='authenticatedusers')
 
     log.info('Add views')
     here = lambda p: os.path.join(os.path.abspath(os.path.dirname(__file__)), p)
     static = static_view(here('static'), use_subpath=True)
-    files = static_view(
+    # fallback of the files view for everything but regular files
+    config.registry.settings['static_files'] = static_view(
         os.path.abspath(config.registry.settings['root_dir']),
         use_subpath=True)
 
     config.add_view(static, route_name='static')
-    config.add_view(files, route_name='files', permission='authenticatedusers')
     config.scan()
 
     log.info('Start app')
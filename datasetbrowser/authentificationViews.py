@@ -1,5 +1,4 @@
 import logging
-import os
 
 import jsonpickle
 from pyramid.httpexceptions import HTTPFound
@@ -7,7 +6,6 @@ from pyramid.security import forget, remember
 from pyramid.view import view_config, forbidden_view_config
 
 from datasetbrowser.requesthandler.directoryRequestHandler import DirectoryRequestHandler
-from datasetbrowser.requesthandler.fileHandler import open_resource
 
 
 class AuthentificationViews:
@@ -24,15 +22,13 @@ class AuthentificationViews:
 
         # load the information
         try:
+            if description_is_private:
+                return None
             relative_path = DirectoryRequestHandler.requestfolderpath(self.request)
-            description = os.path.join(relative_path, '.description.json')
-            if not os.path.exists(description) or description_is_private:
+            description_obj = self.request.registry.settings['description_store'].get(relative_path)
+            if description_obj is None:
                 return None
-            else:
-                with open_resource(description) as file:
-                    json_file = file.read()
-                    description_obj = jsonpickle.decode(json_file)
-                    return description_obj['shortdescription']
+            return description_obj['shortdescription']
         except BaseException as e:
             log = logging.getLogger(__name__)
             log.error(e.message)
@@ -47,15 +47,7 @@ class FileCommentView():
         return comments
 
     def _retrieve_label(self, file):
-        logger = logging.getLogger(__name__)
-        db_label = DBSession.query(FileLabelModel.id, FileLabelModel.label).filter(
-            FileLabelModel.filename == file
-        ).all()
-        if len(db_label) > 0:
-            label = db_label[-1][1]
-        else:
-            label = ''
-        return label
+        return FileLabelModel.newest_labels([file]).get(file, '')
 
 
     @view_config(route_name='files_comment', permission='authenticatedusers', renderer='template/index.pt')
@@ -1,17 +1,20 @@
-import csv
 import hoedown
+import json
 import os
+import urllib
 
-from chameleon import PageTemplate
+from pyramid.httpexceptions import HTTPBadRequest, HTTPNotFound
 from pyramid.renderers import render
 from pyramid.response import Response
 from pyramid.view import view_config
 
 from datasetbrowser.requesthandler.MatlabParser import MatlabParser
+from datasetbrowser.requesthandler.csvColumnStore import CSVColumnStore
 from datasetbrowser.requesthandler.csvHandler import CSVHandler
 from datasetbrowser.requesthandler.directoryRequestHandler import DirectoryRequestHandler
 from datasetbrowser.requesthandler.directorySettingsHandler import DirectoryUpdateLocalSettings
 from datasetbrowser.requesthandler.fileHandler import open_resource
+from datasetbrowser.requesthandler.fileResponseHandler import FileResponseHandler
 
 
 class FileSpecificViews:
@@ -19,41 +22,222 @@ class FileSpecificViews:
         self.request = request
         self.logged_in = request.authenticated_userid
 
+    def _cached_fragment(self, path, options, render_fragment):
+        """
+        Returns the html rendered from a file, which is only rendered once per version (mtime, size) of the file
+        and renderer options
+        :param path: path of the rendered file
+        :param options: hashable options of the renderer (template, extensions, ...)
+        :param render_fragment: function rendering the html
+        :return: html
+        """
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            return render_fragment()
+        # the templates contain absolute urls of the static files
+        key = (os.path.abspath(path), file_stat.st_mtime, file_stat.st_size, options, self.request.application_url)
+        fragment_cache = self.request.registry.settings['rendered_fragment_cache']
+        html = fragment_cache.get(key)
+        if html is None:
+            html = render_fragment()
+            fragment_cache.set(key, html)
+        return html
+
+    def _int_param(self, name, default, minimum, maximum=None):
+        """
+        Returns the integer request parameter name, raises HTTPBadRequest if it is invalid
+        :param name: name of the parameter
+        :param default: value if the parameter is missing
+        :param minimum: smallest valid value
+        :param maximum: largest valid value, None for no upper bound
+        :return:
+        """
+        try:
+            value = int(self.request.params.get(name, default))
+        except ValueError:
+            value = None
+        if value is None or value < minimum or (maximum is not None and value > maximum):
+            if maximum is None:
+                raise HTTPBadRequest('{0} has to be an integer of at least {1}'.format(name, minimum))
+            raise HTTPBadRequest('{0} has to be an integer between {1} and {2}'.format(name, minimum, maximum))
+        return value
+
+    def _float_param(self, name):
+        """
+        Returns the numeric request parameter name or None if it is missing or empty, raises HTTPBadRequest if it
+        is invalid
+        """
+        value = self.request.params.get(name, '')
+        if value == '':
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            raise HTTPBadRequest('{0} has to be a number'.format(name))
+
+    def _column_param(self, name, columns):
+        """
+        Returns the column index of the request parameter name or None if it is missing or empty, raises
+        HTTPBadRequest if it isn't one of columns
+        """
+        value = self.request.params.get(name, '')
+        if value == '':
+            return None
+        try:
+            column = int(value)
+        except ValueError:
+            column = None
+        if column not in columns:
+            raise HTTPBadRequest('{0} has to be the index of a numeric column'.format(name))
+        return column
+
+    def _csv_selection(self, path, profile):
+        """
+        Sorts and filters the data rows of a csv file by the parameters sort (index of a numeric column), order
+        (asc or desc), filter (index of a numeric column), min and max using the column store
+        :param path: path of the csv file
+        :param profile: profile of the csv file
+        :return: tuple (indices of the selected data rows or None if neither sort nor filter is requested, dict of
+        the selection parameters)
+        """
+        column_store = self.request.registry.settings.get('csv_column_store')
+        params = self.request.params
+        if column_store is None or ('sort' not in params and 'filter' not in params):
+            return None, dict()
+        numeric_columns = CSVColumnStore.numeric_columns(profile)
+        sort = self._column_param('sort', numeric_columns)
+        filter_column = self._column_param('filter', numeric_columns)
+        minimum = self._float_param('min')
+        maximum = self._float_param('max')
+        if params.get('order', '') not in ('', 'asc', 'desc'):
+            raise HTTPBadRequest('order has to be asc or desc')
+        descending = params.get('order') == 'desc'
+        if sort is None and filter_column is None:
+            return None, dict()
+        selection = column_store.select(path, profile, sort, descending, filter_column, minimum, maximum)
+        if selection is None:
+            raise HTTPNotFound()
+        selection_query = dict([(key, params[key]) for key in ('sort', 'order', 'filter', 'min', 'max')
+                                if params.get(key, '') != ''])
+        return selection, selection_query
+
     @view_config(route_name='csv', renderer='template/index.pt', permission='authenticatedusers')
     @view_config(route_name='csv_delimiter', renderer='template/index.pt', permission='authenticatedusers')
     def csv_table(self):
         relative_path = DirectoryRequestHandler.requestfilepath(self.request)
-        delimit = CSVHandler.getdelimiter(relative_path, self.request.matchdict)
-
-        with open_resource(relative_path) as csv_file:
-            reader = csv.reader(csv_file, delimiter=delimit)
-            table = PageTemplate('''<table class="table table-striped table-bordered table-condensed">
-                <tr tal:repeat="row table"><td tal:repeat="cell row" tal:content="cell"/></tr>
-                </table>''')
-            table_html = table(table=reader)
+        not_modified = FileResponseHandler.conditional(self.request, relative_path)
+        if not_modified is not None:
+            return not_modified
+        profile = CSVHandler.getprofile(relative_path, self.request.matchdict)
+        rows = self._int_param('rows', self.request.registry.settings.get('csv.rows_per_page', 100), 1,
+                               CSVHandler.max_rows_per_page)
+        start = self._int_param('start', self._int_param('page', 0, 0) * rows, 0)
+
+        selection, selection_query = self._csv_selection(relative_path, profile)
+        row_index = self.request.registry.settings['csv_row_index']
+        header = profile['header']
+        # start, rows and total_rows count data rows, the header is shown on every page instead
+        header_rows = 1 if profile['has_header'] else 0
+        if selection is not None:
+            # rows sorted or filtered by the column store
+            offsets = row_index.offsets(relative_path, quotechar=profile['quotechar'],
+                                        delimiter=profile['delimiter'])
+            if offsets is None:
+                raise HTTPNotFound()
+            row_numbers = selection[start:start + rows] + header_rows
+            table = CSVHandler.read_selected_rows(relative_path, profile['delimiter'], row_numbers, offsets,
+                                                  profile['quotechar'])
+            total_rows = len(selection)
+        else:
+            # the first page is read directly, while the row index is built in the background for the following
+            # ones
+            offsets = row_index.offsets(relative_path, build=False, quotechar=profile['quotechar'],
+                                        delimiter=profile['delimiter'])
+            if offsets is None and start > 0:
+                offsets = row_index.offsets(relative_path, quotechar=profile['quotechar'],
+                                            delimiter=profile['delimiter'])
+            elif offsets is None:
+                row_index.prepare(relative_path, profile['quotechar'], profile['delimiter'])
+            table = CSVHandler.read_rows(relative_path, profile['delimiter'], start + header_rows, rows, offsets,
+                                         profile['quotechar'])
+            total_rows = max(0, len(offsets) - 1 - header_rows) if offsets is not None else None
+        statistics = CSVHandler.cached_statistics(relative_path, profile)
+        if statistics is None and CSVColumnStore.numeric_columns(profile):
+            # computed in the background while the page is loaded, the page requests them afterwards
+            CSVHandler.prepare_statistics(relative_path, profile)
+        table_html = render('template/csv_table.pt', dict(
+            request=self.request, header=header, table=table, start=start, count=len(table), rows=rows,
+            total_rows=total_rows, columns=profile['columns'],
+            numeric_columns=CSVColumnStore.numeric_columns(profile),
+            sortable='csv_column_store' in self.request.registry.settings, selection_query=selection_query,
+            query=lambda **parameters: '?' + urllib.urlencode(dict(selection_query, **parameters)),
+            statistics=json.dumps(statistics) if statistics is not None else None,
+            statistics_url=self.request.route_url('csv_stats', file=self.request.matchdict['file']),
+            has_next=len(table) == rows and (total_rows is None or start + rows < total_rows)))
         return dict(request=self.request, html=table_html, files=dict(), folders=['.', '..'],
                     logged_in=self.request.authenticated_userid)
 
+    @view_config(route_name='csv_stats', renderer='json', permission='authenticatedusers')
+    def csv_statistics(self):
+        """
+        Returns the statistics of the numeric columns of a csv file (see CSVHandler.statistics). They are computed in
+        the background, until they are done 202 Accepted is returned.
+        :return:
+        """
+        relative_path = DirectoryRequestHandler.requestfilepath(self.request)
+        try:
+            bins = int(self.request.params.get('bins', CSVHandler.histogram_bins))
+        except ValueError:
+            raise HTTPBadRequest('bins has to be an integer')
+        if bins < 1 or bins > CSVHandler.max_histogram_bins:
+            raise HTTPBadRequest('bins has to be between 1 and {0}'.format(CSVHandler.max_histogram_bins))
+        not_modified = FileResponseHandler.conditional(self.request, relative_path)
+        if not_modified is not None:
+            return not_modified
+        profile = CSVHandler.profile(relative_path)
+        statistics = CSVHandler.cached_statistics(relative_path, profile, bins)
+        if statistics is not None:
+            return statistics
+        if not CSVHandler.prepare_statistics(relative_path, profile, bins):
+            raise HTTPNotFound()
+        response = Response(status=202, json_body=dict(status='pending'))
+        response.retry_after = 1
+        return response
+
     @view_config(route_name='markdown', renderer='template/index.pt', permission='authenticatedusers')
     def markdown(self):
         markdown_path = DirectoryRequestHandler.requestfilepath(self.request)
-        with open_resource(markdown_path) as markdown_file:
-            source = markdown_file.read()
-            source = str(source)
-            html = hoedown.Markdown(
-                hoedown.HtmlRenderer(hoedown.HTML_TOC_TREE),
-                hoedown.EXT_TABLES).render(source)
-            html = render('template/markdown.pt', {"request": self.request, "html": html})
+        not_modified = FileResponseHandler.conditional(self.request, markdown_path)
+        if not_modified is not None:
+            return not_modified
+        def render_markdown():
+            with open_resource(markdown_path) as markdown_file:
+                source = markdown_file.read()
+                source = str(source)
+                html = hoedown.Markdown(
+                    hoedown.HtmlRenderer(hoedown.HTML_TOC_TREE),
+                    hoedown.EXT_TABLES).render(source)
+                return render('template/markdown.pt', {"request": self.request, "html": html})
+
+        html = self._cached_fragment(markdown_path, ('template/markdown.pt', hoedown.HTML_TOC_TREE,
+                                                     hoedown.EXT_TABLES), render_markdown)
         return dict(request=self.request, html=html, files=dict(), folders=['.', '..'],
                     logged_in=self.request.authenticated_userid)
 
     @view_config(route_name='matlab', renderer='template/index.pt', permission='authenticatedusers')
     def matlab(self):
         matlab_path = DirectoryRequestHandler.requestfilepath(self.request)
+        not_modified = FileResponseHandler.conditional(self.request, matlab_path)
+        if not_modified is not None:
+            return not_modified
+
+        def render_matlab():
+            with open_resource(matlab_path) as matlab_file:
+                source = matlab_file.read()
+                return render('template/matlab.pt', {"request": self.request, "html": source})
 
-        with open_resource(matlab_path) as matlab_file:
-            source = matlab_file.read()
-            matlab_html = render('template/matlab.pt', {"request": self.request, "html": source})
+        matlab_html = self._cached_fragment(matlab_path, ('template/matlab.pt',), render_matlab)
         return dict(request=self.request, html=matlab_html, files=dict(), folders=['.', '..'],
                     logged_in=self.request.authenticated_userid)
 
@@ -71,6 +255,9 @@ class FileSpecificViews:
         params_json = dict(self.request.params)
         if 'updatelocalsettingsfile' in params_json and 'newsettings' in params_json:
             return DirectoryUpdateLocalSettings.handle_request(self.request, jsonpath, None)
+        not_modified = FileResponseHandler.conditional(self.request, jsonpath)
+        if not_modified is not None:
+            return not_modified
 
         with open_resource(jsonpath) as json:
             source = json.read()
@@ -91,12 +278,17 @@ class FileSpecificViews:
         :return:
         """
         matlabpath = DirectoryRequestHandler.requestfilepath(self.request)
+        not_modified = FileResponseHandler.conditional(self.request, matlabpath)
+        if not_modified is not None:
+            return not_modified
         if self.request.matched_route.name == 'matlabfileviewer_subpath':
             subkeypath = self.request.matchdict['subkeypath']
             split_keys = subkeypath.split('&')
             keydict = MatlabParser(matlabpath).specific_element(split_keys)
             keydict = {split_keys[-1]: keydict}
-            return Response(render('template/matfiles_overview.pt', dict(keydictionaries=keydict)))
+            response = Response(render('template/matfiles_overview.pt', dict(keydictionaries=keydict)))
+            FileResponseHandler.conditional(self.request, matlabpath, response)
+            return response
 
         matlabheaders = ['Keys', 'Values']
         keydict = MatlabParser(matlabpath).retrieve_structure()
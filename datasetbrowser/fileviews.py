@@ -0,0 +1,31 @@
+import os
+import stat
+
+from pyramid.view import view_config
+
+from datasetbrowser.requesthandler.fileResponseHandler import FileResponseHandler
+
+
+class FileViews:
+    def __init__(self, request):
+        self.request = request
+
+    @view_config(route_name='files', permission='authenticatedusers')
+    def files(self):
+        """
+        Serves the raw files below the root_dir with validators and Range support. Everything else (folders without
+        trailing slash, missing files, ...) is left to the static view over the root_dir.
+        :return:
+        """
+        root_dir = os.path.abspath(self.request.registry.settings['root_dir'])
+        subpath = self.request.matchdict['subpath']
+        path = os.path.abspath(os.path.join(root_dir, *subpath))
+        if self.request.method in ('GET', 'HEAD') and path.startswith(os.path.join(root_dir, '')) and \
+                '..' not in subpath:
+            try:
+                path_stat = os.stat(path)
+            except OSError:
+                path_stat = None
+            if path_stat is not None and stat.S_ISREG(path_stat.st_mode):
+                return FileResponseHandler.file_response(self.request, path, path_stat)
+        return self.request.registry.settings['static_files'](self.request.context, self.request)
@@ -0,0 +1,53 @@
+import logging
+import multiprocessing
+
+from pyramid.httpexceptions import HTTPNotFound, HTTPServiceUnavailable
+from pyramid.response import FileResponse, Response
+from pyramid.view import view_config
+
+from datasetbrowser.requesthandler.directoryExportHandlers import ReportExportHandler
+
+
+class ReportJobViews:
+    def __init__(self, request):
+        self.request = request
+
+    def _job(self):
+        job = self.request.registry.settings['report_jobs'].job(self.request.matchdict['jobid'])
+        if job is None:
+            raise HTTPNotFound('Unknown job {0}'.format(self.request.matchdict['jobid']))
+        return job
+
+    @view_config(route_name='report_job', permission='authenticatedusers', renderer='json')
+    def report_job(self):
+        return ReportExportHandler.job_status(self.request, self._job())
+
+    @view_config(route_name='report_job_result', permission='authenticatedusers')
+    def report_job_result(self):
+        job = self._job()
+        if job['status'] != 'done':
+            response = Response(status=202, json_body=ReportExportHandler.job_status(self.request, job))
+            response.location = self.request.route_url('report_job', jobid=job['id'])
+            return response
+        response = FileResponse(job['path'], request=self.request, content_type='application/pdf')
+        response.content_disposition = ReportExportHandler.content_disposition(job)
+        response.etag = job['key']
+        response.conditional_response = True
+        return response
+
+
+class WorkerTimeoutView:
+    def __init__(self, request):
+        self.request = request
+
+    @view_config(context=multiprocessing.TimeoutError)
+    def worker_timeout(self):
+        """
+        The worker pool didn't return a result in time, e.g. because a worker process died
+        :return: 503 Service Unavailable
+        """
+        log = logging.getLogger(__name__)
+        log.error('The worker pool timed out while handling {0}'.format(self.request.url))
+        response = HTTPServiceUnavailable('The request timed out, please try again later')
+        response.retry_after = 60
+        return response
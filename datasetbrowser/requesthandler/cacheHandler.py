@@ -0,0 +1,99 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def cache_directory(settings, name):
+    """
+    Returns (and creates) the directory of a disk cache. All disk caches are subdirectories of the directory set by
+    cache.directory, by default in the temporary directory of the system.
+    :param settings: application settings
+    :param name: name of the cache
+    :return: path of the directory
+    """
+    root = settings.get('cache.directory', os.path.join(tempfile.gettempdir(), 'datasetbrowser'))
+    path = os.path.join(root, name)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return path
+
+
+class LRUCache:
+    """
+    Thread-safe, size bounded key-value store which evicts the least recently used entries first. Besides the number
+    of entries, the total size of the values can be bounded by max_bytes, in which case sizeof returns the size of a
+    value.
+    """
+    def __init__(self, max_entries=128, max_bytes=None, sizeof=len):
+        assert (max_entries >= 1)
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries = OrderedDict()
+        self._sizes = dict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    @property
+    def bytes(self):
+        """
+        :return: total size of the cached values, 0 if max_bytes isn't set
+        """
+        return self._bytes
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored for key and marks it as recently used
+        :param key:
+        :param default: returned if the key is not cached
+        :return:
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            value = self._entries.pop(key)
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def _remove(self, key):
+        del self._entries[key]
+        self._bytes -= self._sizes.pop(key, 0)
+
+    def set(self, key, value):
+        size = self._sizeof(value) if self._max_bytes is not None else 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self._max_bytes is not None and size > self._max_bytes:
+                # would evict everything else
+                return
+            self._entries[key] = value
+            if self._max_bytes is not None:
+                self._sizes[key] = size
+                self._bytes += size
+            while len(self._entries) > self._max_entries or \
+                    (self._max_bytes is not None and self._bytes > self._max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def remove(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
@@ -0,0 +1,185 @@
+import hashlib
+import logging
+import os
+import tempfile
+import urllib
+
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.response import FileResponse, Response
+
+from datasetbrowser.requesthandler.directoryListing import DirectoryListing
+from datasetbrowser.requesthandler.directoryRequestHandler import DirectoryRequestHandler
+from datasetbrowser.requesthandler.directorySettingsHandler import DirectoryLoadSettings
+from datasetbrowser.requesthandler.itemgrouper import ItemGrouper
+from datasetbrowser.requesthandler.thumbnailHandler import ThumbnailHandler
+from datasetbrowser.requesthandler.workerPool import WorkerPool
+
+
+def _compose_sheet(args):
+    """
+    Pastes the thumbnails centered into their tiles of a transparent png, using PIL or else matplotlib.
+    :param args: tuple (list of (path of the thumbnail, x, y), width, height, tile size, path of the sheet)
+    :return:
+    """
+    tiles, width, height, size, target = args
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    if Image is not None:
+        sheet = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+        for path, x, y in tiles:
+            tile = Image.open(path).convert('RGBA')
+            sheet.paste(tile, (x + (size - tile.size[0]) // 2, y + (size - tile.size[1]) // 2))
+        sheet.save(target, 'PNG', optimize=True)
+        return
+    import numpy
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.image
+    sheet = numpy.zeros((height, width, 4), dtype=numpy.float32)
+    for path, x, y in tiles:
+        tile = matplotlib.image.imread(path)
+        if tile.dtype != numpy.float32:
+            tile = tile.astype(numpy.float32) / 255.0
+        if tile.ndim == 2:
+            tile = numpy.dstack([tile, tile, tile])
+        if tile.shape[2] == 3:
+            tile = numpy.dstack([tile, numpy.ones(tile.shape[:2], dtype=numpy.float32)])
+        top = y + (size - tile.shape[0]) // 2
+        left = x + (size - tile.shape[1]) // 2
+        sheet[top:top + tile.shape[0], left:left + tile.shape[1]] = tile
+    matplotlib.image.imsave(target, sheet, format='png')
+
+
+class ContactSheetHandler(DirectoryRequestHandler):
+    """
+    Composes the thumbnails of one page of rows of a specific filetemplate into a single image (contact sheet),
+    thus the browser loads all figures of the page with one request. Every row of the grouping is a row of tiles of
+    size x size pixels. Enabled by "contact_sheet": true in the specific filetemplate.
+    """
+
+    @staticmethod
+    def sheet_url(key, page, size):
+        """
+        :return: url of the contact sheet relative to the directory
+        """
+        return '?' + urllib.urlencode(dict(contactsheet=key.encode('utf-8'), page=page, size=size))
+
+    @staticmethod
+    def layout(tree, columns, size):
+        """
+        Places the files of the grouped files on the contact sheet. The rows are placed in the order in which they
+        are displayed, i.e. with sorted keys.
+        :param tree: grouped files (e.g. a page returned by ItemGrouper.paginate)
+        :param columns: maximal number of elements per row
+        :param size: edge length of a tile
+        :return: tuple (list of dict(filename, group, x, y), width, height)
+        """
+        tiles = []
+        counter = dict(row=0)
+
+        def place(node, group):
+            if isinstance(node, dict):
+                for key in sorted(node.keys()):
+                    place(node[key], group + [key])
+            elif isinstance(node, list):
+                for row in node:
+                    row = row if isinstance(row, list) else [row]
+                    for column, filename in enumerate(row[:columns]):
+                        tiles.append(dict(filename=filename, group='/'.join(group), x=column * size,
+                                          y=counter['row'] * size))
+                    counter['row'] += 1
+
+        place(tree, [])
+        return tiles, max(1, columns) * size, max(1, counter['row']) * size
+
+    @staticmethod
+    def _compose(request, relative_path, tiles, width, height, size):
+        """
+        Returns the contact sheet, which is created if it isn't cached yet
+        :return: tuple (path of the sheet, key)
+        """
+        thumbnails = request.registry.settings['thumbnails'].thumbnails(
+            [os.path.join(relative_path, tile['filename']) for tile in tiles], size)
+        placed_thumbnails = []
+        for tile in tiles:
+            thumbnail_path, thumbnail_key = thumbnails[os.path.join(relative_path, tile['filename'])]
+            if thumbnail_path is not None:
+                placed_thumbnails.append((thumbnail_path, thumbnail_key, tile['x'], tile['y']))
+        key = hashlib.sha1(repr((width, height, size, [(thumbnail_key, x, y) for path, thumbnail_key, x, y
+                                                       in placed_thumbnails])).encode('utf-8')).hexdigest()
+
+        sheet_cache = request.registry.settings['contact_sheets']
+        cached_path = sheet_cache.get(key)
+        if cached_path is not None:
+            return cached_path, key
+        handle, temppath = tempfile.mkstemp(suffix='.part', dir=sheet_cache.directory)
+        os.close(handle)
+        try:
+            arguments = ([(path, x, y) for path, thumbnail_key, x, y in placed_thumbnails], width, height, size,
+                         temppath)
+            pool = WorkerPool.get()
+            if pool is not None:
+                WorkerPool.result(pool.apply_async(_compose_sheet, (arguments,)))
+            else:
+                _compose_sheet(arguments)
+            cached_path = sheet_cache.add(key, temppath)
+            if cached_path is None:
+                raise ValueError('the contact sheet exceeds the size of the cache')
+            return cached_path, key
+        finally:
+            if os.path.exists(temppath):
+                os.remove(temppath)
+
+    @staticmethod
+    def handle_request(request, relative_path, directory_settings):
+        """
+        Returns the contact sheet of a page of rows or with the parameter map its layout as json
+        :param request: parameters contactsheet (key of the specific filetemplate), page, size and map
+        :param relative_path:
+        :param directory_settings:
+        :return:
+        """
+        key = request.params['contactsheet']
+        extension_specific = directory_settings.get('specific_filetemplates', dict()).get(key)
+        if not isinstance(extension_specific, dict) or not extension_specific.get('contact_sheet', False):
+            raise HTTPNotFound('No contact sheet enabled for {0}'.format(key))
+        try:
+            page = int(request.params.get('page', 0))
+            size = int(request.params.get('size', DirectoryRequestHandler.thumbnail_size(request,
+                                                                                         extension_specific)))
+        except ValueError:
+            raise HTTPNotFound()
+        if size < ThumbnailHandler.min_size or size > ThumbnailHandler.max_size:
+            raise HTTPNotFound()
+
+        entries = DirectoryListing.list(relative_path)
+        grouping_fingerprint = DirectoryRequestHandler.fingerprint(
+            entries, [DirectoryLoadSettings.settings_version(directory_settings)])
+        itemgrouper = ItemGrouper()
+        grouped_items, visible_items, invisible_items = itemgrouper.cached_group_folder(
+            request.registry.settings['directory_grouping_cache'], relative_path, DirectoryListing.names(entries),
+            directory_settings, grouping_fingerprint)
+        if key not in grouped_items:
+            raise HTTPNotFound()
+        rows_per_page = DirectoryRequestHandler.rows_per_page(request, extension_specific)
+        if rows_per_page > 0:
+            tree, total_rows = itemgrouper.paginate(grouped_items[key], page * rows_per_page, rows_per_page)
+        else:
+            tree, total_rows = itemgrouper.paginate(grouped_items[key], 0)
+        tiles, width, height = ContactSheetHandler.layout(tree, extension_specific.get('elements_per_row', 1), size)
+
+        if 'map' in request.params:
+            return Response(json_body=dict(url=ContactSheetHandler.sheet_url(key, page, size), tile_size=size,
+                                           width=width, height=height, tiles=tiles))
+        try:
+            sheet_path, sheet_key = ContactSheetHandler._compose(request, relative_path, tiles, width, height, size)
+        except Exception as e:
+            log = logging.getLogger(__name__)
+            log.warning('Unable to compose the contact sheet {0} of {1}: {2}'.format(key, relative_path, e))
+            raise HTTPNotFound()
+        response = FileResponse(sheet_path, request=request, content_type='image/png')
+        response.etag = sheet_key
+        response.conditional_response = True
+        return response
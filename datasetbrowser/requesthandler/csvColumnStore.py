@@ -0,0 +1,188 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+import numpy
+
+from datasetbrowser.requesthandler.csvHandler import CSVHandler
+from datasetbrowser.requesthandler.csvRowIndex import CSVRowIndex
+
+
+class CSVColumnStore:
+    """
+    Columnar copy of the numeric columns of csv files, every column is stored as float64 .npy file (empty or invalid
+    values are nan) in a disk cache keyed by path, mtime, size and delimiter of the csv file and the column. The
+    columns are opened memory mapped, thus the rows of a csv file are sorted and filtered without parsing it again.
+    The element i of a column belongs to the data row i, i.e. the header isn't counted.
+    """
+
+    def __init__(self, cache):
+        """
+        :param cache: DiskCache storing the columns and their sort orders
+        """
+        self._cache = cache
+        self._lock = threading.Lock()
+        # key of the csv file -> event, which is set as soon as its columns are converted
+        self._building = dict()
+
+    @staticmethod
+    def column_key(path, profile, column, kind='values'):
+        """
+        :param path: path of the csv file
+        :param profile: profile of the csv file (see CSVHandler.profile)
+        :param column: index of the column
+        :param kind: 'values' or 'order' (indices of the data rows sorted by the column)
+        :return: key or None, if the file doesn't exist
+        """
+        try:
+            csv_stat = os.stat(path)
+        except OSError:
+            return None
+        return hashlib.sha1(repr((os.path.abspath(path), csv_stat.st_mtime, csv_stat.st_size, profile['delimiter'],
+                                  column, kind)).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def numeric_columns(profile):
+        return [column for column in range(profile['columns']) if profile['types'][column] != 'text']
+
+    def _convert(self, path, profile):
+        """
+        Converts all numeric columns of a csv file in one pass over the file
+        :return: dictionary column -> values loaded into memory of the columns, which are too large for the cache
+        """
+        columns = CSVColumnStore.numeric_columns(profile)
+        raw_files = []
+        uncached = dict()
+        try:
+            for column in columns:
+                handle, rawpath = tempfile.mkstemp(suffix='.part', dir=self._cache.directory)
+                raw_files.append((rawpath, os.fdopen(handle, 'w+b')))
+            count = 0
+            for chunk_rows, chunk in CSVHandler.numeric_chunks(path, profile, columns):
+                count += chunk_rows
+                for (rawpath, raw_file), values in zip(raw_files, chunk):
+                    raw_file.write(values.astype('<f8').tobytes())
+            for column, (rawpath, raw_file) in zip(columns, raw_files):
+                handle, temppath = tempfile.mkstemp(suffix='.part', dir=self._cache.directory)
+                try:
+                    CSVRowIndex.write_npy(raw_file, os.fdopen(handle, 'wb'), '<f8', count)
+                    if self._cache.add(CSVColumnStore.column_key(path, profile, column), temppath) is None:
+                        uncached[column] = numpy.load(temppath)
+                finally:
+                    if os.path.exists(temppath):
+                        os.remove(temppath)
+        finally:
+            for rawpath, raw_file in raw_files:
+                raw_file.close()
+                os.remove(rawpath)
+        return uncached
+
+    def _load(self, key):
+        cached_path = self._cache.get(key) if key is not None else None
+        if cached_path is None:
+            return None
+        try:
+            return numpy.load(cached_path, mmap_mode='r')
+        except (IOError, OSError, ValueError):
+            return None
+
+    def column(self, path, profile, column):
+        """
+        Returns the values of a numeric column, the numeric columns of the file are converted if the column isn't
+        cached
+        :param path: path of the csv file
+        :param profile: profile of the csv file
+        :param column: index of the column
+        :return: memory mapped float64 array (loaded into memory, if it is too large for the cache) or None, if the
+        column isn't numeric or the file doesn't exist
+        """
+        if column not in CSVColumnStore.numeric_columns(profile):
+            return None
+        key = CSVColumnStore.column_key(path, profile, column)
+        values = self._load(key)
+        if values is not None or key is None:
+            return values
+        file_key = (CSVRowIndex.index_key(path), profile['delimiter'])
+        with self._lock:
+            event = self._building.get(file_key)
+            building = event is None
+            if building:
+                event = self._building[file_key] = threading.Event()
+        if not building:
+            event.wait()
+            values = self._load(key)
+            if values is not None:
+                return values
+            # too large for the cache, thus the column is converted on this thread as well
+            return self._convert(path, profile).get(column)
+        try:
+            uncached = self._convert(path, profile)
+        finally:
+            with self._lock:
+                del self._building[file_key]
+            event.set()
+        return uncached[column] if column in uncached else self._load(key)
+
+    def order(self, path, profile, column):
+        """
+        Returns the indices of the data rows sorted ascending by a numeric column, nan values are sorted last. The
+        order is computed once per version of the file and cached as well.
+        :return: memory mapped int64 array or None, if the column isn't numeric
+        """
+        key = CSVColumnStore.column_key(path, profile, column, 'order')
+        order = self._load(key)
+        if order is not None:
+            return order
+        values = self.column(path, profile, column)
+        if values is None:
+            return None
+        handle, temppath = tempfile.mkstemp(suffix='.part', dir=self._cache.directory)
+        try:
+            with os.fdopen(handle, 'wb') as order_file:
+                numpy.save(order_file, numpy.argsort(values, kind='mergesort').astype('<i8'))
+            if self._cache.add(key, temppath) is None:
+                return numpy.load(temppath)
+        finally:
+            if os.path.exists(temppath):
+                os.remove(temppath)
+        return self._load(key)
+
+    def select(self, path, profile, sort=None, descending=False, filter_column=None, minimum=None, maximum=None):
+        """
+        Returns the data rows of a csv file, which pass the range filter, in the requested order
+        :param path: path of the csv file
+        :param profile: profile of the csv file
+        :param sort: index of the numeric column the rows are sorted by, None keeps the order of the file
+        :param descending: sort descending, nan values are still last
+        :param filter_column: index of the numeric column the range filter is applied to, None doesn't filter
+        :param minimum: smallest value passing the filter, None for no lower bound
+        :param maximum: largest value passing the filter, None for no upper bound
+        :return: int64 array of indices of data rows or None, if a requested column isn't numeric or neither sort
+        nor filter is requested
+        """
+        mask = None
+        if filter_column is not None:
+            values = self.column(path, profile, filter_column)
+            if values is None:
+                return None
+            mask = numpy.ones(len(values), dtype=bool)
+            # nan values never pass the filter
+            with numpy.errstate(invalid='ignore'):
+                if minimum is not None:
+                    mask &= values >= minimum
+                if maximum is not None:
+                    mask &= values <= maximum
+                if minimum is None and maximum is None:
+                    mask &= ~numpy.isnan(values)
+        if sort is None:
+            return numpy.flatnonzero(mask) if mask is not None else None
+        order = self.order(path, profile, sort)
+        if order is None:
+            return None
+        if descending:
+            nan_count = numpy.count_nonzero(numpy.isnan(self.column(path, profile, sort)))
+            order = numpy.concatenate([order[:len(order) - nan_count][::-1], order[len(order) - nan_count:]])
+        if mask is not None:
+            order = order[mask[order]]
+        return order
@@ -1,11 +1,39 @@
+import csv
+import logging
+import os
+import threading
+from itertools import islice
+
+import numpy
+from pyramid.exceptions import NotFound
+
+from datasetbrowser.requesthandler.cacheHandler import LRUCache
 from datasetbrowser.requesthandler.fileHandler import open_resource
 
 
 class CSVHandler:
+    max_rows_per_page = 10000
+    possible_delimiters = ['\t', ',', ';', ' ']
+    # bytes at the beginning of a file, from which its dialect, header and column types are inferred
+    sample_size = 64 * 1024
+    # path, delimiter -> (mtime, size), profile
+    _profiles = LRUCache(1024)
+    # rows converted to arrays at once while computing the column statistics
+    statistics_chunk_rows = 64 * 1024
+    histogram_bins = 20
+    max_histogram_bins = 1000
+    # path, delimiter, bins -> (mtime, size), statistics
+    _statistics = LRUCache(256)
+    # path, delimiter, bins -> (mtime, size) of the versions, whose statistics are computed in the background or
+    # failed
+    _statistics_building = dict()
+    _statistics_failed = LRUCache(256)
+    _statistics_lock = threading.Lock()
+
     @staticmethod
     def _detect_csv_delimiter(text, possible_delimiter=None):
         if not possible_delimiter:
-            possible_delimiter = ['\t', ',', ';', ' ']
+            possible_delimiter = CSVHandler.possible_delimiters
         min_delimiter = 0
         delimit = possible_delimiter[0]
         for delimiter in possible_delimiter:
@@ -16,8 +44,97 @@ class CSVHandler:
         return delimit
 
     @staticmethod
-    def getdelimiter(path, requestdictionary):
-        auto_detect_delimiter = False
+    def _column_type(values):
+        """
+        :param values: values of a column, empty values are ignored
+        :return: 'int', 'float' or 'text'
+        """
+        column_type = 'int'
+        for value in values:
+            value = value.strip()
+            if value == '':
+                continue
+            if column_type == 'int':
+                try:
+                    int(value)
+                    continue
+                except ValueError:
+                    column_type = 'float'
+            try:
+                float(value)
+            except ValueError:
+                return 'text'
+        return column_type
+
+    @staticmethod
+    def _create_profile(path, delimiter=None):
+        with open_resource(path, 'rb') as csv_file:
+            sample = csv_file.read(CSVHandler.sample_size)
+            truncated = len(csv_file.read(1)) > 0
+        if truncated and b'\n' in sample:
+            # the last line of the sample is incomplete
+            sample = sample[:sample.rindex(b'\n') + 1]
+        sniffer = csv.Sniffer()
+        quotechar = '"'
+        if delimiter is None:
+            try:
+                dialect = sniffer.sniff(sample, delimiters=''.join(CSVHandler.possible_delimiters))
+                delimiter = dialect.delimiter
+                quotechar = dialect.quotechar or quotechar
+            except csv.Error:
+                delimiter = CSVHandler._detect_csv_delimiter(sample)
+        rows = [row for row in csv.reader(sample.splitlines(), delimiter=str(delimiter), quotechar=str(quotechar))
+                if len(row) > 0]
+        try:
+            has_header = len(rows) > 1 and sniffer.has_header(sample)
+        except csv.Error:
+            has_header = False
+        if not has_header and len(rows) > 1:
+            # a first row of text above numeric columns is a header as well
+            first_row_types = [CSVHandler._column_type([value]) for value in rows[0]]
+            has_header = all([column_type == 'text' for column_type in first_row_types]) and \
+                any([CSVHandler._column_type([row[column] for row in rows[1:] if column < len(row)]) != 'text'
+                     for column in range(len(rows[0]))])
+        header = rows[0] if has_header else None
+        data_rows = rows[1:] if has_header else rows
+        columns = max([len(row) for row in rows]) if rows else 0
+        types = [CSVHandler._column_type([row[column] for row in data_rows if column < len(row)])
+                 for column in range(columns)]
+        return dict(delimiter=str(delimiter), quotechar=str(quotechar), has_header=has_header, header=header,
+                    columns=columns, types=types)
+
+    @staticmethod
+    def profile(path, delimiter=None):
+        """
+        Returns the profile of a csv file, which is inferred from a sample of its beginning. Each version (mtime,
+        size) of a file is only sampled once.
+        :param path: path of the csv file
+        :param delimiter: delimiter of the file, None detects it
+        :return: dict(delimiter, quotechar, has_header, header (list or None), columns (number), types (list of
+        'int', 'float' or 'text' per column))
+        """
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            raise NotFound()
+        signature = (file_stat.st_mtime, file_stat.st_size)
+        key = (os.path.abspath(path), delimiter)
+        cached = CSVHandler._profiles.get(key)
+        if cached is None or cached[0] != signature:
+            cached = (signature, CSVHandler._create_profile(path, delimiter))
+            CSVHandler._profiles.set(key, cached)
+        return cached[1]
+
+    @staticmethod
+    def getprofile(path, requestdictionary):
+        """
+        Returns the profile of a csv file with the delimiter requested by the delimiter parameter of the route, it is
+        detected if none or 'auto' is requested
+        :param path: path of the csv file
+        :param requestdictionary: matchdict of the request
+        :return: profile, see profile
+        """
+        delimit = None
         if 'delimiter' in requestdictionary:
             delimit = str(requestdictionary['delimiter'])
             if delimit in ['tab', '/t']:
@@ -25,14 +142,215 @@ class CSVHandler:
             elif delimit == 'space':
                 delimit = str(' ')
             elif delimit == 'auto':
-                auto_detect_delimiter = True
-                delimit = str(',')
-        else:
-            auto_detect_delimiter = True
-            delimit = str(',')
-
-        if auto_detect_delimiter:
-            with open_resource(path) as csv_file:
-                possible_delimiters = ['\t', ',', ';', ' ']
-                delimit = path._detect_csv_delimiter(csv_file.read(), possible_delimiters)
-        return delimit
\ No newline at end of file
+                delimit = None
+        return CSVHandler.profile(path, delimit)
+
+    @staticmethod
+    def getdelimiter(path, requestdictionary):
+        return CSVHandler.getprofile(path, requestdictionary)['delimiter']
+
+    @staticmethod
+    def read_rows(path, delimiter, start, count, offsets=None, quotechar='"'):
+        """
+        Reads a window of rows of a csv file
+        :param path: path of the csv file
+        :param delimiter:
+        :param start: index of the first row, the header counts as row
+        :param count: maximal number of rows
+        :param offsets: row offsets (see CSVRowIndex), without them the rows before start are parsed and skipped
+        :param quotechar:
+        :return: list of rows
+        """
+        with open_resource(path, 'rb') as csv_file:
+            if offsets is None:
+                return list(islice(csv.reader(csv_file, delimiter=delimiter, quotechar=quotechar), start,
+                                   start + count))
+            if start >= len(offsets) - 1:
+                return []
+            csv_file.seek(int(offsets[start]))
+            return list(islice(csv.reader(csv_file, delimiter=delimiter, quotechar=quotechar), count))
+
+    @staticmethod
+    def read_selected_rows(path, delimiter, row_numbers, offsets, quotechar='"'):
+        """
+        Reads single rows of a csv file by seeking to each of them
+        :param path: path of the csv file
+        :param delimiter:
+        :param row_numbers: indices of the rows in the requested order, the header counts as row
+        :param offsets: row offsets (see CSVRowIndex)
+        :param quotechar:
+        :return: list of rows
+        """
+        rows = []
+        with open_resource(path, 'rb') as csv_file:
+            for row_number in row_numbers:
+                if row_number >= len(offsets) - 1:
+                    continue
+                csv_file.seek(int(offsets[row_number]))
+                rows.append(next(csv.reader(csv_file, delimiter=delimiter, quotechar=quotechar), []))
+        return rows
+
+    @staticmethod
+    def _to_float(value):
+        try:
+            return float(value)
+        except ValueError:
+            return numpy.nan
+
+    @staticmethod
+    def _to_array(values):
+        """
+        Converts the values of a column to float64, the conversion is done by numpy unless a value is invalid
+        """
+        try:
+            return numpy.array(values).astype(numpy.float64)
+        except ValueError:
+            return numpy.array([CSVHandler._to_float(value) for value in values], dtype=numpy.float64)
+
+    @staticmethod
+    def numeric_chunks(path, profile, columns):
+        """
+        Reads the numeric columns of a csv file in chunks of statistics_chunk_rows rows, empty or invalid values are
+        nan
+        :param path: path of the csv file
+        :param profile: profile of the csv file
+        :param columns: indices of the numeric columns
+        :return: generator of tuples (number of rows, list of float64 arrays, one per column)
+        """
+        with open_resource(path, 'rb') as csv_file:
+            reader = csv.reader(csv_file, delimiter=profile['delimiter'], quotechar=profile['quotechar'])
+            if profile['has_header']:
+                next(reader, None)
+            while True:
+                rows = list(islice(reader, CSVHandler.statistics_chunk_rows))
+                if not rows:
+                    return
+                yield len(rows), [CSVHandler._to_array([row[column] if column < len(row) else ''
+                                                        for row in rows]) for column in columns]
+
+    @staticmethod
+    def _compute_statistics(path, profile, bins):
+        columns = [column for column in range(profile['columns']) if profile['types'][column] != 'text']
+        count = numpy.zeros(len(columns), dtype=numpy.int64)
+        nan_count = numpy.zeros(len(columns), dtype=numpy.int64)
+        total = numpy.zeros(len(columns), dtype=numpy.float64)
+        minimum = numpy.full(len(columns), numpy.inf)
+        maximum = numpy.full(len(columns), -numpy.inf)
+        rows = 0
+        for chunk_rows, chunk in CSVHandler.numeric_chunks(path, profile, columns):
+            rows += chunk_rows
+            for i, values in enumerate(chunk):
+                finite = values[numpy.isfinite(values)]
+                nan_count[i] += numpy.count_nonzero(numpy.isnan(values))
+                count[i] += len(finite)
+                if len(finite) > 0:
+                    total[i] += finite.sum()
+                    minimum[i] = min(minimum[i], finite.min())
+                    maximum[i] = max(maximum[i], finite.max())
+        # the range of the histograms is only known after the first pass
+        histograms = [numpy.zeros(bins, dtype=numpy.int64) for column in columns]
+        edges = [numpy.linspace(minimum[i], maximum[i] if maximum[i] > minimum[i] else minimum[i] + 1, bins + 1)
+                 if count[i] > 0 else None for i in range(len(columns))]
+        if any([edge is not None for edge in edges]):
+            for chunk_rows, chunk in CSVHandler.numeric_chunks(path, profile, columns):
+                for i, values in enumerate(chunk):
+                    if edges[i] is not None:
+                        histograms[i] += numpy.histogram(values[numpy.isfinite(values)], bins=edges[i])[0]
+
+        names = profile['header'] or []
+        statistics = []
+        for column in range(profile['columns']):
+            column_statistics = dict(index=column, name=names[column] if column < len(names) else None,
+                                     type=profile['types'][column])
+            if column in columns:
+                i = columns.index(column)
+                valid = count[i] > 0
+                column_statistics.update(
+                    count=int(count[i]), nan=int(nan_count[i]),
+                    min=float(minimum[i]) if valid else None, max=float(maximum[i]) if valid else None,
+                    mean=float(total[i] / count[i]) if valid else None,
+                    histogram=dict(edges=[float(edge) for edge in edges[i]],
+                                   counts=[int(c) for c in histograms[i]]) if valid else None)
+            statistics.append(column_statistics)
+        return dict(rows=rows, columns=statistics)
+
+    @staticmethod
+    def cached_statistics(path, profile, bins=None):
+        """
+        :return: the statistics of a csv file if they are already computed for its current version, otherwise None
+        """
+        bins = CSVHandler.histogram_bins if bins is None else bins
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            return None
+        cached = CSVHandler._statistics.get((os.path.abspath(path), profile['delimiter'], bins))
+        if cached is None or cached[0] != (file_stat.st_mtime, file_stat.st_size):
+            return None
+        return cached[1]
+
+    @staticmethod
+    def statistics(path, profile, bins=None):
+        """
+        Computes min, max, mean, the number of nan (empty or invalid) values and a histogram of every numeric column.
+        The file is read in chunks of statistics_chunk_rows rows, thus the required memory doesn't depend on the
+        size of the file. Like the profile, the statistics are computed once per version (mtime, size) of the file.
+        :param path: path of the csv file
+        :param profile: profile of the csv file
+        :param bins: number of bins of the histograms
+        :return: dict(rows, columns (list of dict(index, name, type, count, nan, min, max, mean, histogram (dict(edges,
+        counts)))), the statistics are only set for numeric columns
+        """
+        bins = CSVHandler.histogram_bins if bins is None else bins
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            raise NotFound()
+        signature = (file_stat.st_mtime, file_stat.st_size)
+        key = (os.path.abspath(path), profile['delimiter'], bins)
+        cached = CSVHandler._statistics.get(key)
+        if cached is None or cached[0] != signature:
+            cached = (signature, CSVHandler._compute_statistics(path, profile, bins))
+            CSVHandler._statistics.set(key, cached)
+        return cached[1]
+
+    @staticmethod
+    def prepare_statistics(path, profile, bins=None):
+        """
+        Computes the statistics in a background thread, if they are neither cached nor being computed
+        :param path: path of the csv file
+        :param profile: profile of the csv file
+        :param bins: number of bins of the histograms
+        :return: False if the computation failed for the current version of the file, otherwise True
+        """
+        bins = CSVHandler.histogram_bins if bins is None else bins
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            return False
+        signature = (file_stat.st_mtime, file_stat.st_size)
+        key = (os.path.abspath(path), profile['delimiter'], bins)
+        with CSVHandler._statistics_lock:
+            if CSVHandler._statistics_failed.get(key) == signature:
+                return False
+            if CSVHandler._statistics_building.get(key) == signature or \
+                    CSVHandler.cached_statistics(path, profile, bins) is not None:
+                return True
+            CSVHandler._statistics_building[key] = signature
+
+        def compute():
+            try:
+                CSVHandler.statistics(path, profile, bins)
+            except Exception as e:
+                log = logging.getLogger(__name__)
+                log.warning('Unable to compute the statistics of {0}: {1}'.format(path, e))
+                CSVHandler._statistics_failed.set(key, signature)
+            finally:
+                with CSVHandler._statistics_lock:
+                    if CSVHandler._statistics_building.get(key) == signature:
+                        del CSVHandler._statistics_building[key]
+
+        thread = threading.Thread(target=compute, name='CSVStatistics')
+        thread.daemon = True
+        thread.start()
+        return True
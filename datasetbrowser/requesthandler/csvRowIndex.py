@@ -0,0 +1,237 @@
+import csv
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy
+
+
+class CSVRowIndex:
+    """
+    Sidecar index of the byte offsets of the rows of a csv file, thus any window of rows is read by seeking to its
+    first row. The index is built in one sequential pass and stored as int64 .npy file in a disk cache keyed by
+    path, mtime and size of the csv file, its delimiter and quote character, it is opened memory mapped. A newline
+    only ends a row if an even number of quote characters precedes it, i.e. quoted fields may contain newlines. From
+    a quote character within an unquoted field on, which csv.reader keeps as part of the field, the rows are
+    found by csv.reader instead.
+    """
+    chunk_size = 4 * 1024 * 1024
+
+    def __init__(self, cache):
+        """
+        :param cache: DiskCache storing the indices
+        """
+        self._cache = cache
+        self._lock = threading.Lock()
+        # key -> event, which is set as soon as the index is built
+        self._building = dict()
+
+    @staticmethod
+    def index_key(path, quotechar='"', delimiter=','):
+        """
+        :param path: path of the csv file
+        :param quotechar: quote character of the csv file
+        :param delimiter: delimiter of the csv file
+        :return: key of the index, None if the file doesn't exist
+        """
+        try:
+            csv_stat = os.stat(path)
+        except OSError:
+            return None
+        return hashlib.sha1(repr((os.path.abspath(path), csv_stat.st_mtime, csv_stat.st_size,
+                                  quotechar, delimiter)).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _write_offsets(csv_file, offsets_file, chunk_size, quotechar='"', delimiter=','):
+        """
+        Writes the offsets of the row starts followed by the size of the file as raw int64
+        :return: number of written offsets
+        """
+        written = 0
+        position = 0
+        quote_parity = 0
+        # the file starts like a row, i.e. a quote character in the first byte opens a field
+        last_byte = b'\n'
+        offsets_file.write(numpy.zeros(1, dtype='<i8').tobytes())
+        written += 1
+        while True:
+            chunk = csv_file.read(chunk_size)
+            if not chunk:
+                break
+            data = numpy.frombuffer(chunk, dtype=numpy.uint8)
+            quotes = data == ord(quotechar)
+            parity = (numpy.cumsum(quotes) + quote_parity) & 1
+            row_ends = numpy.flatnonzero((data == ord('\n')) & (parity == 0))
+            # a quote character outside of quotes only opens a field at the start of the field, or escapes a quote
+            # character right after the end of a quoted field. Otherwise csv.reader keeps it as part of the field.
+            previous = numpy.empty_like(data)
+            previous[0] = ord(last_byte)
+            previous[1:] = data[:-1]
+            literal_quotes = numpy.flatnonzero(quotes & (parity == 1) & (previous != ord(delimiter)) &
+                                               (previous != ord('\n')) & (previous != ord(quotechar)))
+            if len(literal_quotes) > 0:
+                row_ends = row_ends[row_ends < literal_quotes[0]]
+            offsets = (row_ends + (position + 1)).astype('<i8')
+            offsets_file.write(offsets.tobytes())
+            written += len(offsets)
+            if len(literal_quotes) > 0:
+                row_start = int(offsets[-1]) if len(offsets) > 0 else CSVRowIndex._last_offset(offsets_file)
+                return written + CSVRowIndex._write_reader_offsets(csv_file, offsets_file, row_start, quotechar,
+                                                                   delimiter)
+            quote_parity = int(parity[-1])
+            position += len(chunk)
+            last_byte = chunk[-1:]
+        if position == 0:
+            return written
+        if last_byte != b'\n':
+            # last row without newline
+            offsets_file.write(numpy.array([position], dtype='<i8').tobytes())
+            written += 1
+        return written
+
+    @staticmethod
+    def _last_offset(offsets_file):
+        offsets_file.seek(-8, os.SEEK_END)
+        last_offset = int(numpy.frombuffer(offsets_file.read(8), dtype='<i8')[0])
+        offsets_file.seek(0, os.SEEK_END)
+        return last_offset
+
+    @staticmethod
+    def _write_reader_offsets(csv_file, offsets_file, row_start, quotechar='"', delimiter=','):
+        """
+        Writes the offsets of the rows following row_start as found by csv.reader, which is much slower than
+        counting quote characters
+        :return: number of written offsets
+        """
+        csv_file.seek(row_start)
+        state = dict(position=row_start)
+
+        def lines():
+            for line in iter(csv_file.readline, b''):
+                state['position'] += len(line)
+                yield line
+
+        written = 0
+        offsets = []
+        try:
+            # the reader only reads the lines of the next row, thus the position is the end of the row
+            for row in csv.reader(lines(), delimiter=str(delimiter), quotechar=str(quotechar)):
+                offsets.append(state['position'])
+                if len(offsets) == 64 * 1024:
+                    offsets_file.write(numpy.array(offsets, dtype='<i8').tobytes())
+                    written += len(offsets)
+                    offsets = []
+        except csv.Error as e:
+            # the rest of the file is a single row
+            log = logging.getLogger(__name__)
+            log.warning('Unable to index the rows from byte {0} on: {1}'.format(state['position'], e))
+            csv_file.seek(0, os.SEEK_END)
+            offsets.append(csv_file.tell())
+        offsets_file.write(numpy.array(offsets, dtype='<i8').tobytes())
+        return written + len(offsets)
+
+    @staticmethod
+    def write_npy(raw_file, npy_file, descr, count):
+        """
+        Writes an array, whose length was unknown while its raw data was written, as .npy file
+        :param raw_file: file containing the raw data of the array
+        :param npy_file: file the array is written to, it is closed afterwards
+        :param descr: numpy dtype descriptor of the data (e.g. '<i8')
+        :param count: number of elements
+        :return:
+        """
+        raw_file.seek(0)
+        with npy_file:
+            numpy.lib.format.write_array_header_1_0(npy_file, dict(descr=descr, fortran_order=False, shape=(count,)))
+            shutil.copyfileobj(raw_file, npy_file)
+
+    def _build(self, path, key, quotechar, delimiter):
+        """
+        Reads the csv file once and adds its index to the cache
+        :return: memory mapped index, or the index loaded into memory if it is too large for the cache
+        """
+        handle, rawpath = tempfile.mkstemp(suffix='.part', dir=self._cache.directory)
+        handle_npy, temppath = tempfile.mkstemp(suffix='.part', dir=self._cache.directory)
+        try:
+            with os.fdopen(handle, 'w+b') as offsets_file:
+                with open(path, 'rb') as csv_file:
+                    count = CSVRowIndex._write_offsets(csv_file, offsets_file, self.chunk_size, quotechar,
+                                                      delimiter)
+                CSVRowIndex.write_npy(offsets_file, os.fdopen(handle_npy, 'wb'), '<i8', count)
+            cached_path = self._cache.add(key, temppath)
+            if cached_path is None:
+                return numpy.load(temppath)
+            return numpy.load(cached_path, mmap_mode='r')
+        finally:
+            for part in (rawpath, temppath):
+                if os.path.exists(part):
+                    os.remove(part)
+
+    def offsets(self, path, build=True, quotechar='"', delimiter=','):
+        """
+        Returns the row offsets of a csv file, the row i spans the bytes offsets[i] to offsets[i + 1]
+        :param path: path of the csv file
+        :param build: build the index if it isn't cached, otherwise None is returned in this case
+        :param quotechar: quote character of the csv file
+        :param delimiter: delimiter of the csv file
+        :return: memory mapped int64 array of length (number of rows + 1) or None, if the file doesn't exist or the
+        index isn't cached and build is False
+        """
+        key = CSVRowIndex.index_key(path, quotechar, delimiter)
+        if key is None:
+            return None
+        while True:
+            cached_path = self._cache.get(key)
+            if cached_path is not None:
+                try:
+                    return numpy.load(cached_path, mmap_mode='r')
+                except (IOError, OSError, ValueError):
+                    # evicted in the meantime or unreadable, thus it is built again
+                    pass
+            if not build:
+                return None
+            with self._lock:
+                event = self._building.get(key)
+                building = event is None
+                if building:
+                    event = self._building[key] = threading.Event()
+            if not building:
+                # the index is cached by now, unless the build failed or the index is too large for the cache. In
+                # this case it is built by this thread.
+                event.wait()
+                continue
+            try:
+                return self._build(path, key, quotechar, delimiter)
+            finally:
+                with self._lock:
+                    del self._building[key]
+                event.set()
+
+    def prepare(self, path, quotechar='"', delimiter=','):
+        """
+        Builds the index in a background thread, if it is neither cached nor being built
+        :param path: path of the csv file
+        :param quotechar: quote character of the csv file
+        :param delimiter: delimiter of the csv file
+        :return:
+        """
+        key = CSVRowIndex.index_key(path, quotechar, delimiter)
+        if key is None or self._cache.get(key) is not None:
+            return
+        with self._lock:
+            if key in self._building:
+                return
+
+        def build():
+            try:
+                self.offsets(path, quotechar=quotechar, delimiter=delimiter)
+            except Exception as e:
+                log = logging.getLogger(__name__)
+                log.warning('Unable to index {0}: {1}'.format(path, e))
+
+        thread = threading.Thread(target=build, name='CSVRowIndex')
+        thread.daemon = True
+        thread.start()
@@ -0,0 +1,57 @@
+import os
+
+import jsonpickle
+
+from datasetbrowser.requesthandler.cacheHandler import LRUCache
+
+
+class DirectoryDescriptionStore:
+    """
+    Caches the decoded .description.json files of the folders. A cached description is only used as long as mtime
+    and size of its file are unchanged.
+    """
+    filename = '.description.json'
+
+    def __init__(self, max_entries=4096):
+        self._cache = LRUCache(max_entries)
+
+    def get(self, folder):
+        """
+        Returns the description of the folder
+        :param folder: path of the folder
+        :return: decoded description or None if the folder has no description file
+        """
+        description_path = os.path.join(folder, self.filename)
+        try:
+            description_stat = os.stat(description_path)
+        except OSError:
+            return None
+        signature = (description_stat.st_mtime, description_stat.st_size)
+        cached = self._cache.get(description_path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        with open(description_path) as description_file:
+            description = jsonpickle.decode(description_file.read())
+        self._cache.set(description_path, (signature, description))
+        return description
+
+    def descriptions(self, folder, subfolders):
+        """
+        Returns the descriptions of all subfolders of a listing. Only files changed since the last call are decoded.
+        :param folder: path of the folder
+        :param subfolders: names of the subfolders
+        :return: dictionary subfolder -> description, subfolders without (valid) description are omitted
+        """
+        descriptions = dict()
+        for subfolder in subfolders:
+            try:
+                description = self.get(os.path.join(folder, subfolder))
+            except Exception:
+                continue
+            if description is not None:
+                descriptions[subfolder] = description
+        return descriptions
+
+    def invalidate(self, folder):
+        self._cache.remove(os.path.join(folder, self.filename))
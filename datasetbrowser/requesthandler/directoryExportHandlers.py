@@ -1,20 +1,52 @@
 import os
 import time
+import uuid
 
+import pdfkit
 from markdown import markdown
-from pdfkit import pdfkit
+from pyramid.httpexceptions import HTTPBadRequest
 from pyramid.renderers import render
-from pyramid.response import Response
+from pyramid.response import FileResponse, Response
 
+from datasetbrowser.requesthandler.directoryListing import DirectoryListing
 from datasetbrowser.requesthandler.directoryRequestHandler import DirectoryRequestHandler
+from datasetbrowser.requesthandler.directorySettingsHandler import DirectoryLoadSettings
+from datasetbrowser.requesthandler.fileResponseHandler import FileResponseHandler
+from datasetbrowser.requesthandler.itemgrouper import ItemGrouper
 from datasetbrowser.requesthandler.markdownexport import PresentationMarkdownExport, MarkdownExport
 
 
 class PresentationExportHandler(DirectoryRequestHandler):
+    # stands for the markdown while rendering the template, thus the page can be split around it
+    markdown_marker = '<!--markdown-{0}-->'.format(uuid.uuid4().hex)
+    chunk_size = 16 * 1024
+
+    @staticmethod
+    def _encoded_chunks(pieces):
+        """
+        Joins the pieces of the page to chunks of at least chunk_size bytes
+        :param pieces: iterable of strings
+        :return: generator of utf-8 encoded chunks
+        """
+        chunk = []
+        chunk_length = 0
+        for piece in pieces:
+            if isinstance(piece, unicode):
+                piece = piece.encode('utf-8')
+            chunk.append(piece)
+            chunk_length += len(piece)
+            if chunk_length >= PresentationExportHandler.chunk_size:
+                yield b''.join(chunk)
+                chunk = []
+                chunk_length = 0
+        if chunk:
+            yield b''.join(chunk)
+
     @staticmethod
     def handle_request(request, relative_path, directory_settings):
         """
-        Handles the request to present a folder or a specific filetype in a folder as a markdown based presentation
+        Handles the request to present a folder or a specific filetype in a folder as a markdown based presentation.
+        The page is sent while the markdown of the folder is generated.
         :param request:
         :param relative_path:
         :param directory_settings:
@@ -24,33 +56,97 @@ class PresentationExportHandler(DirectoryRequestHandler):
         specific_filetype = None
         if 'specific' in dict(request.params):
             specific_filetype = request.params['specific']
-        output = '# Presentation\n{0}\n---\n'.format(time.strftime('%d.%m.%Y'))
-        output += presmd.export_folder(relative_path, directory_settings, specific_filetype)
-        htmloutput = render('template/markdown_presentation.pt', dict(markdown=output))
-        return Response(htmloutput)
+        page = render('datasetbrowser:template/markdown_presentation.pt',
+                      dict(markdown=PresentationExportHandler.markdown_marker), request=request)
+        page_head, page_tail = page.split(PresentationExportHandler.markdown_marker, 1)
+
+        def presentation():
+            yield page_head
+            yield '# Presentation\n{0}\n---\n'.format(time.strftime('%d.%m.%Y'))
+            for section in presmd.iter_export(relative_path, directory_settings, specific_filetype):
+                yield section
+            yield page_tail
+        return Response(app_iter=PresentationExportHandler._encoded_chunks(presentation()),
+                        content_type='text/html', charset='utf-8')
 
 
 class ReportExportHandler(DirectoryRequestHandler):
+    @staticmethod
+    def job_status(request, job):
+        """
+        Public state of a report job
+        :param request:
+        :param job: job dictionary of the ReportJobQueue
+        :return:
+        """
+        status = dict(id=job['id'], status=job['status'], error=job['error'],
+                      url=request.route_url('report_job', jobid=job['id']))
+        if job['status'] == 'done':
+            status['result'] = request.route_url('report_job_result', jobid=job['id'])
+        return status
+
+    @staticmethod
+    def content_disposition(job):
+        if job['filename'] is None:
+            return None
+        return FileResponseHandler.content_disposition('inline', job['filename'])
+
+    @staticmethod
+    def _render_report(relative_path, directory_settings, specific_filetype, grouping_cache, wkhtmltopdf):
+        """
+        Returns the function rendering the report on a worker thread. It only captures the values it needs, not the
+        request, which ends before the report is rendered.
+        """
+        def render_report(output_path):
+            mdexport = MarkdownExport(None, grouping_cache)
+            output = mdexport.export_folder(relative_path, directory_settings, specific_filetype)
+            html_text = markdown(output, output_format='html4')
+            config = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf) if wkhtmltopdf else pdfkit.configuration()
+            pdfkit.from_string(html_text, output_path, configuration=config)
+        return render_report
+
     @staticmethod
     def handle_request(request, relative_path, directory_settings):
         """
-        Handles the PDF requests
+        Handles the PDF requests. The report is rendered by a background job, as long as it isn't done the state
+        of the job is returned (202 Accepted), which can be polled at its url.
         :param request:
         :param relative_path:
         :param directory_settings:
         :return:
         """
-        mdexport = MarkdownExport(request)
         specific_filetype = None
         if 'specific' in dict(request.params):
             specific_filetype = request.params['specific']
-        output = mdexport.export_folder(relative_path, directory_settings, specific_filetype)
-        html_text = markdown(output, output_format='html4')
-        # TODO: fix this Path problem
-        config = pdfkit.configuration(wkhtmltopdf='C:\\Program Files\\wkhtmltopdf\\bin\\wkhtmltopdf.exe')
-        # TODO: replace by mkdtemp
-        if not os.path.exists(relative_path + '/.temp/'):
-            os.mkdir(relative_path + '/.temp/')
-        pdfkit.from_string(html_text, relative_path + '/.temp/report.pdf', configuration=config)
-        with open(relative_path + '/.temp/report.pdf', 'rb') as report:
-            return Response(body=report.read(), content_type='application/pdf')
+        entries = DirectoryListing.list(relative_path)
+        grouping_cache = request.registry.settings['directory_grouping_cache']
+        if specific_filetype is not None:
+            # only the keys of the grouping are valid, other values would queue a job for each of them
+            grouping_fingerprint = DirectoryRequestHandler.fingerprint(
+                entries, [DirectoryLoadSettings.settings_version(directory_settings)])
+            grouped_items, visible_items, invisible_items = ItemGrouper().cached_group_folder(
+                grouping_cache, relative_path, DirectoryListing.names(entries), directory_settings,
+                grouping_fingerprint)
+            if specific_filetype not in grouped_items:
+                raise HTTPBadRequest('specific has to be a group of the folder')
+        fingerprint = DirectoryRequestHandler.fingerprint(
+            entries, ['report', specific_filetype, DirectoryLoadSettings.settings_version(directory_settings)])
+        filename = os.path.basename(os.path.abspath(relative_path))
+        if specific_filetype is not None:
+            filename += '_' + specific_filetype
+        filename += '.pdf'
+
+        report_jobs = request.registry.settings['report_jobs']
+        render_report = ReportExportHandler._render_report(relative_path, directory_settings, specific_filetype,
+                                                           grouping_cache,
+                                                           request.registry.settings.get('report.wkhtmltopdf'))
+        job = report_jobs.submit(fingerprint, render_report, filename)
+        if job['status'] == 'done':
+            response = FileResponse(job['path'], request=request, content_type='application/pdf')
+            response.content_disposition = ReportExportHandler.content_disposition(job)
+            response.etag = fingerprint
+            response.conditional_response = True
+            return response
+        response = Response(status=202, json_body=ReportExportHandler.job_status(request, job))
+        response.location = request.route_url('report_job', jobid=job['id'])
+        return response
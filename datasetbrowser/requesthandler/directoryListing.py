@@ -0,0 +1,72 @@
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
+
+
+class ListingEntry:
+    """
+    Element of a directory listing. Type, size and mtime are retrieved at most once, for the type usually without
+    any additional system call.
+    """
+    __slots__ = ['name', 'path', '_entry', '_is_dir', '_stat']
+
+    def __init__(self, dir_entry):
+        self.name = dir_entry.name
+        self.path = dir_entry.path
+        self._entry = dir_entry
+        self._is_dir = None
+        self._stat = None
+
+    def is_dir(self):
+        if self._is_dir is None:
+            try:
+                self._is_dir = self._entry.is_dir()
+            except OSError:
+                self._is_dir = False
+        return self._is_dir
+
+    def stat(self):
+        """
+        :return: stat result or None, if the element can't be accessed (e.g. a broken symlink)
+        """
+        if self._stat is None:
+            try:
+                self._stat = self._entry.stat()
+            except OSError:
+                return None
+        return self._stat
+
+    @property
+    def size(self):
+        element_stat = self.stat()
+        return element_stat.st_size if element_stat is not None else None
+
+    @property
+    def mtime(self):
+        element_stat = self.stat()
+        return element_stat.st_mtime if element_stat is not None else None
+
+
+class DirectoryListing:
+    sort_keys = {'name': lambda entry: entry.name,
+                 'mtime': lambda entry: entry.mtime,
+                 'size': lambda entry: entry.size}
+
+    @staticmethod
+    def list(path, sort=None, reverse=False):
+        """
+        Lists the content of a directory with a single scandir call
+        :param path: path of the directory
+        :param sort: None (order of the filesystem), 'name', 'mtime' or 'size'
+        :param reverse:
+        :return: list of ListingEntry
+        """
+        entries = [ListingEntry(dir_entry) for dir_entry in scandir(path)]
+        if sort is not None:
+            entries.sort(key=DirectoryListing.sort_keys[sort], reverse=reverse)
+        return entries
+
+    @staticmethod
+    def names(entries):
+        return [entry.name for entry in entries]
@@ -1,3 +1,4 @@
+import hashlib
 import os
 
 
@@ -15,6 +16,54 @@ class DirectoryRequestHandler:
             request.registry.settings['root_dir'],
             request.matchdict['file'])
 
+    @staticmethod
+    def fingerprint(entries, versions=None):
+        """
+        Computes a fingerprint of the folder content. It changes as soon as an element (or the description of a
+        subfolder) is added, removed or modified, or one of the additional versions changes.
+        :param entries: listing of the folder as returned by DirectoryListing.list
+        :param versions: list of additional values the fingerprint depends on (e.g. the settings version)
+        :return: hex digest
+        """
+        sha = hashlib.sha1()
+        for entry in sorted(entries, key=lambda e: e.name):
+            description_mtime = None
+            if entry.is_dir():
+                try:
+                    description_mtime = os.stat(os.path.join(entry.path, '.description.json')).st_mtime
+                except OSError:
+                    pass
+            sha.update(repr((entry.name, entry.mtime, entry.size, description_mtime)).encode('utf-8'))
+        for version in versions or []:
+            sha.update(repr(version).encode('utf-8'))
+        return sha.hexdigest()
+
+    @staticmethod
+    def rows_per_page(request, extension_specific):
+        """
+        Number of rows of a specific filetemplate rendered per page (0 renders all rows)
+        :param request:
+        :param extension_specific: settings of the specific filetemplate
+        :return:
+        """
+        rows_per_page = int(request.registry.settings.get('directory.rows_per_page', 50))
+        if isinstance(extension_specific, dict) and 'rows_per_page' in extension_specific:
+            rows_per_page = int(extension_specific['rows_per_page'])
+        return rows_per_page
+
+    @staticmethod
+    def thumbnail_size(request, extension_specific):
+        """
+        Edge length of the thumbnails of a specific filetemplate (0 shows the original images)
+        :param request:
+        :param extension_specific: settings of the specific filetemplate
+        :return:
+        """
+        thumbnail_size = int(request.registry.settings.get('thumbnail.size', 256))
+        if isinstance(extension_specific, dict) and 'thumbnail_size' in extension_specific:
+            thumbnail_size = int(extension_specific['thumbnail_size'])
+        return thumbnail_size
+
     @staticmethod
     def handle_request(request, relative_path, directory_settings):
         pass
@@ -1,15 +1,100 @@
 import HTMLParser
+import hashlib
+import json
 import logging
+import mimetypes
 import os
+import re
 import shutil
 
 import jsonpickle
 from pyramid.renderers import render
 from pyramid.response import Response
 
+from datasetbrowser.requesthandler.cacheHandler import LRUCache
 from datasetbrowser.requesthandler.directoryRequestHandler import DirectoryRequestHandler
 
 
+class CompiledDirectorySettings:
+    """
+    Preprocessed form of the directory settings, which classifies the files of a directory without parsing any
+    rule again.
+    """
+    criteria_types = ['mimetype:', 'regex:']
+    # lowercased suffix -> mimetype
+    _mimetypes = LRUCache(1024)
+
+    def __init__(self, directory_settings):
+        # rules containing flags, named groups or backreferences can't be combined into one alternation
+        self.blacklist = []
+        combinable_rules = []
+        for rule in directory_settings.get('blacklist') or []:
+            if rule == '':
+                continue
+            if re.search(r'\(\?[aiLmsux]|\(\?P|\\[0-9]', rule) is not None:
+                self.blacklist.append(re.compile(rule))
+            else:
+                combinable_rules.append('(?:{0})'.format(rule))
+        if len(combinable_rules) > 0:
+            self.blacklist.insert(0, re.compile('|'.join(combinable_rules)))
+
+        self.criteria = []
+        self.group_by = dict()
+        specific_filetemplates = directory_settings.get('specific_filetemplates')
+        if isinstance(specific_filetemplates, dict):
+            for (key, extension_specific) in specific_filetemplates.items():
+                for criteria_type in self.criteria_types:
+                    if key.startswith(criteria_type):
+                        self.criteria.append((key, criteria_type, re.compile(key[len(criteria_type):])))
+                        break
+                try:
+                    self.group_by[key] = [re.compile(str(rule)) for rule in extension_specific['group_by']]
+                except Exception:
+                    # keep the raw rules, the grouping reports the error
+                    if isinstance(extension_specific, dict) and 'group_by' in extension_specific:
+                        self.group_by[key] = extension_specific['group_by']
+
+    @staticmethod
+    def guess_mimetype(filename):
+        """
+        Memoized mimetypes.guess_type. The result only depends on the extension of the filename, and on the
+        extension before it if the last one is an encoding (e.g. .tar.gz).
+        :param filename:
+        :return: mimetype or None
+        """
+        parts = filename.lower().split('.')
+        suffix = '.' + parts[-1] if len(parts) > 1 else ''
+        if len(parts) > 2 and (suffix in mimetypes.encodings_map or suffix in mimetypes.suffix_map):
+            suffix = '.' + parts[-2] + suffix
+        mimetype = CompiledDirectorySettings._mimetypes.get(suffix, False)
+        if mimetype is False:
+            mimetype = mimetypes.guess_type('file' + suffix)[0]
+            CompiledDirectorySettings._mimetypes.set(suffix, mimetype)
+        return mimetype
+
+    def is_blacklisted(self, filename):
+        for rule in self.blacklist:
+            if rule.search(filename) is not None:
+                return True
+        return False
+
+    def specific_criteria(self, filename):
+        """
+        Returns the first specific filter criteria (e.g. regex:README.md$) matching the file or None
+        :param filename:
+        :return:
+        """
+        for (key, criteria_type, regex) in self.criteria:
+            element_to_validate = filename
+            if criteria_type == 'mimetype:':
+                element_to_validate = self.guess_mimetype(filename)
+                if element_to_validate is None:
+                    continue
+            if regex.search(element_to_validate) is not None:
+                return key
+        return None
+
+
 class DirectoryCreateLocalSettings(DirectoryRequestHandler):
     @staticmethod
     def handle_request(request, relative_path, directory_settings):
@@ -22,6 +107,7 @@ class DirectoryCreateLocalSettings(DirectoryRequestHandler):
         try:
             with open(relative_path + '/.settings.json', 'w') as settings_file:
                 settings_file.write(jsonpickle.encode(directory_settings, unpicklable=False))
+            DirectoryLoadSettings.invalidate(request.registry.settings['directory_settings'], relative_path)
             return None
         except IOError as e:
             return e.message
@@ -38,76 +124,148 @@ class DirectoryUpdateLocalSettings(DirectoryRequestHandler):
             shutil.copyfile(relative_path, relative_path + '_bak')
             with open(relative_path, 'w') as file:
                 file.write(newsettingsobj)
+            DirectoryLoadSettings.invalidate(request.registry.settings['directory_settings'],
+                                             os.path.dirname(relative_path))
         except Exception as e:
             return Response(render('json', {'error': e.message}))
         return Response(render('json', {'error': None}))
 
 
 class DirectoryLoadSettings(DirectoryRequestHandler):
+    _compiled_settings = LRUCache(32)
+    _parsed_settings = LRUCache(1024)
+
+    @staticmethod
+    def compiled_settings(directory_settings):
+        """
+        Returns the compiled form of the directory settings, it is only built once per settings version
+        :param directory_settings:
+        :return: CompiledDirectorySettings
+        """
+        version = DirectoryLoadSettings.settings_version(directory_settings)
+        compiled = DirectoryLoadSettings._compiled_settings.get(version)
+        if compiled is None:
+            compiled = CompiledDirectorySettings(directory_settings)
+            DirectoryLoadSettings._compiled_settings.set(version, compiled)
+        return compiled
+
+    @staticmethod
+    def settings_version(directory_settings):
+        """
+        Returns a hash of the directory settings, which changes whenever the settings are modified
+        :param directory_settings:
+        :return:
+        """
+        encoded = json.dumps(directory_settings, sort_keys=True, default=str)
+        return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _read_settings_file(filename):
+        """
+        Decodes a settings file. Each version (mtime, size) of a file is only parsed once.
+        :param filename:
+        :return: copy of the decoded settings
+        """
+        file_stat = os.stat(filename)
+        signature = (file_stat.st_mtime, file_stat.st_size)
+        cached = DirectoryLoadSettings._parsed_settings.get(filename)
+        if cached is None or cached[0] != signature:
+            with open(filename, "r") as myfile:
+                data = myfile.read()
+                settings_struct = jsonpickle.decode(data)
+                if not isinstance(settings_struct, dict):
+                    settings_struct = jsonpickle.decode(settings_struct)
+            cached = (signature, settings_struct)
+            DirectoryLoadSettings._parsed_settings.set(filename, cached)
+        return dict(cached[1])
+
+    @staticmethod
+    def resolve(root_dir, relative_path, directory_settings, reload_templates=False, watcher=None):
+        """
+        Returns the effective settings of a folder. They are resolved on first request by walking up to the closest
+        already resolved folder (or the root_dir) and memoized for every folder on the way. A folder with a
+        .settings.json combines it with the settings of its parent folder, otherwise it inherits them.
+        :param root_dir: root directory of the server
+        :param relative_path: absolute path of the folder
+        :param directory_settings: dictionary folder -> effective settings used for the memoization
+        :param reload_templates: value of the reload flag for folders with a settings file
+        :param watcher: SettingsWatcher, which is notified about every newly resolved folder
+        :return: settings dictionary
+        """
+        log = logging.getLogger(__name__)
+        root_dir = os.path.abspath(root_dir)
+
+        # folders without memoized settings, starting with the requested one
+        unresolved = []
+        folder = relative_path
+        while folder not in directory_settings:
+            if folder != root_dir and not folder.startswith(os.path.join(root_dir, '')):
+                break
+            unresolved.append(folder)
+            parent = os.path.dirname(folder)
+            if folder == root_dir or parent == folder:
+                break
+            folder = parent
+        settings = directory_settings.get(folder, dict())
+
+        for folder in reversed(unresolved):
+            filename = os.path.join(folder, '.settings.json')
+            if os.path.isfile(filename):
+                try:
+                    settings_struct = DirectoryLoadSettings._read_settings_file(filename)
+                    settings_struct.update(settings)
+                    settings_struct['reload'] = reload_templates
+                    settings_struct['path'] = filename
+                    settings = settings_struct
+                except Exception as e:
+                    log.error('Unable to load the settings file {0}: {1}'.format(filename, e))
+            directory_settings[folder] = settings
+            if watcher is not None:
+                watcher.watch(folder)
+        return settings
+
+    @staticmethod
+    def invalidate(directory_settings, folder):
+        """
+        Removes the memoized settings of the folder and all its subfolders, e.g. after its settings file changed
+        :param directory_settings: dictionary folder -> effective settings
+        :param folder: absolute path of the folder
+        :return:
+        """
+        folder = os.path.abspath(folder)
+        prefix = os.path.join(folder, '')
+        for memoized_folder in list(directory_settings.keys()):
+            if memoized_folder == folder or memoized_folder.startswith(prefix):
+                directory_settings.pop(memoized_folder, None)
+
     @staticmethod
     def handle_request(request, relative_path, directory_settings):
         """
-        Load the directory settings for the specific directory. Checks if it is indicated that a reload is required.
+        Load the directory settings for the specific directory. If the settings are reloaded (reload_templates),
+        changed settings files are detected by the settings watcher and only those are parsed again.
         :param directorypath: Path of the folder, which should load the files
         :param directorysettings: Dictionary with the specific directory settings
         :return:
         """
         basepath = request.registry.settings['root_dir']
-
-        if relative_path in directory_settings:
-            localsettings = directory_settings[relative_path]
-            if 'reload' in localsettings:
-                reload_templates = localsettings['reload']
-                if reload_templates:
-                    if os.path.exists(localsettings['path']):
-                        with open(localsettings['path'], "r") as myfile:
-                            data = myfile.read()
-                            localsettings = jsonpickle.decode(data)
-                            return localsettings
-                return localsettings
-            return localsettings
-        else:
-            # check if the parent folder has some marked settings
-            previous_folder = os.path.abspath(relative_path + '/../')
-            previous_folder = previous_folder.encode('string-escape')
-            previous_folder = previous_folder.decode('string-escape')
-            if relative_path == basepath:
-                return dict()
-
-            return DirectoryLoadSettings.handle_request(request, previous_folder, directory_settings)
+        reload_templates = request.registry.settings.get('reload_templates', False)
+        watcher = request.registry.settings.get('settings_watcher')
+        if watcher is not None:
+            watcher.check()
+        return DirectoryLoadSettings.resolve(basepath, relative_path, directory_settings, reload_templates, watcher)
 
     @staticmethod
     def load_server_settings(root_dir, config):
+        """
+        Resolves the settings of the root directory. All other folders are resolved on their first request, thus
+        the startup time doesn't depend on the size of the tree.
+        :param root_dir:
+        :param config:
+        :return:
+        """
         assert(hasattr(config, 'registry'))
         assert(hasattr(config.registry, 'settings'))
-        log = logging.getLogger(__name__)
-        for root, dirs, files in os.walk(root_dir):
-            root = os.path.abspath(root)
-            if '.settings.json' in files:
-                lastfolder = os.path.abspath(root + '/..')
-                last_settings = dict()
-                if lastfolder in config.registry.settings['directory_settings']:
-                    last_settings = config.registry.settings['directory_settings'][lastfolder]
-
-                config.registry.settings['directory_settings'][root] = last_settings
-
-                filename = root + '/.settings.json'
-                with open(os.path.join(filename), "r") as myfile:
-                    data = myfile.read()
-                    settings_struct = jsonpickle.decode(data)
-                    if not isinstance(settings_struct, dict):
-                        settings_struct = jsonpickle.decode(settings_struct)
-
-                try:
-                    settings_struct.update(config.registry.settings['directory_settings'][root])
-                    config.registry.settings['directory_settings'][root] = settings_struct
-                    config.registry.settings['directory_settings'][root]['reload'] = config.registry.settings[
-                        'reload_templates']
-                    config.registry.settings['directory_settings'][root]['path'] = filename
-                except Exception as e:
-                    log.error(e.message)
-            else:
-                path = os.path.abspath(root + '/..')
-                if path in config.registry.settings['directory_settings']:
-                    config.registry.settings['directory_settings'][root] = \
-                        config.registry.settings['directory_settings'][path]
+        DirectoryLoadSettings.resolve(root_dir, os.path.abspath(root_dir),
+                                      config.registry.settings['directory_settings'],
+                                      config.registry.settings.get('reload_templates', False),
+                                      config.registry.settings.get('settings_watcher'))
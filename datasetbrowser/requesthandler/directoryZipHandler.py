@@ -1,11 +1,14 @@
 import os
-import tempfile
-from zipfile import ZipFile
 
+from pyramid.httpexceptions import HTTPBadRequest, HTTPNotModified
 from pyramid.response import Response
 
+from datasetbrowser.requesthandler.directoryListing import DirectoryListing
 from datasetbrowser.requesthandler.directoryRequestHandler import DirectoryRequestHandler
+from datasetbrowser.requesthandler.directorySettingsHandler import DirectoryLoadSettings
+from datasetbrowser.requesthandler.fileResponseHandler import FileResponseHandler
 from datasetbrowser.requesthandler.itemgrouper import ItemGrouper
+from datasetbrowser.requesthandler.zipStream import ZipStream
 
 
 class DirectoryZipHandler(DirectoryRequestHandler):
@@ -29,43 +32,83 @@ class DirectoryZipHandler(DirectoryRequestHandler):
         else:
             return [(item, keypath + '/' + item,)]
 
+    @staticmethod
+    def _archive_fingerprint(relative_path, entries, options, compression_level, directory_settings):
+        """
+        Fingerprint of the archive content. It is derived from the listing of the folder, the settings (which
+        determine the grouping) and the request options instead of the members, thus it is known before the folder
+        is grouped.
+        :param relative_path: absolute path of the folder
+        :param entries: listing of the folder as returned by DirectoryListing.list
+        :param options: request parameters, which select the members or their names
+        :return: hex digest
+        """
+        return DirectoryRequestHandler.fingerprint(
+            entries, [relative_path, options, compression_level,
+                      DirectoryLoadSettings.settings_version(directory_settings)])
+
     @staticmethod
     def handle_request(request, relative_path, directory_settings):
         depth = 0
-        listing = os.listdir(relative_path)
+        entries = DirectoryListing.list(relative_path)
+        directories = set([entry.name for entry in entries if entry.is_dir()])
+        listing = DirectoryListing.names(entries)
         relative_path = str(os.path.abspath(relative_path)).encode('string-escape')
         relative_path = relative_path.decode('string-escape')
 
         returnfilename = os.path.basename(relative_path)
+        specific_filetype = request.params.get('specific')
+        nosubfolderallowed = 'key_not_as_folder_separator' in dict(request.params)
+        # zlib level of the members, which are worth compressing. 0 stores all members uncompressed
+        compression_level = min(max(int(directory_settings.get('zip_compression_level', 6)), 0), 9)
+        fingerprint = DirectoryZipHandler._archive_fingerprint(
+            relative_path, entries, (specific_filetype, nosubfolderallowed), compression_level, directory_settings)
+        if fingerprint in request.if_none_match:
+            # the client's copy is still valid, the folder isn't grouped at all
+            response = HTTPNotModified()
+            response.etag = fingerprint
+            return response
 
         # filter the folder content
         itemgrouper = ItemGrouper()
         items_dict, visibleitems, invisibleitems = itemgrouper.group_folder(listing, directory_settings)
 
-        if 'specific' in dict(request.params):
-            specific_filetype = request.params['specific']
-            if specific_filetype in items_dict:
-                items_dict = items_dict[specific_filetype]
-                returnfilename += '_' + specific_filetype
-                depth = 1
+        if specific_filetype is not None:
+            if specific_filetype not in items_dict:
+                raise HTTPBadRequest('specific has to be a group of the folder')
+            items_dict = items_dict[specific_filetype]
+            returnfilename += '_' + specific_filetype
+            depth = 1
 
-        # TODO: Sometimes zip file creation doesnt halt. It seems to be dependent on the fact whether another request.zip file already exists
-        nosubfolderallowed = 'key_not_as_folder_separator' in dict(request.params)
         tuples = DirectoryZipHandler._file_tuples(depth, '', items_dict)
-        tempdirpath = tempfile.mkdtemp()
-        zippath = tempdirpath + '/request.zip'
-        with ZipFile(zippath, 'w') as zip:
-            for tuple in tuples:
-                localfilepath = relative_path + '/' + tuple[0]
-                if tuple[0].startswith('.'):
-                    continue
-                if os.path.isdir(localfilepath):
-                    continue
-                if nosubfolderallowed:
-                    zip.write(localfilepath, tuple[0])
-                else:
-                    zip.write(localfilepath, tuple[1])
-        with open(zippath, 'rb') as zip:
-            return Response(body=zip.read(),
-                            content_type='application/zip',
-                            content_disposition='attachment; filename="{0}.zip"'.format(returnfilename))
+        members = []
+        for tuple in tuples:
+            localfilepath = relative_path + '/' + tuple[0]
+            if tuple[0].startswith('.'):
+                continue
+            if tuple[0] in directories:
+                continue
+            if nosubfolderallowed:
+                members.append((localfilepath, tuple[0]))
+            else:
+                members.append((localfilepath, tuple[1]))
+        content_disposition = FileResponseHandler.content_disposition('attachment', returnfilename + '.zip')
+
+        archive_cache = request.registry.settings.get('archive_cache')
+        if archive_cache is None:
+            # without disk cache the archive is written while it is sent, it can't be resumed
+            response = Response(app_iter=ZipStream(members, compression_level), content_type='application/zip')
+        else:
+            # the archive is completely written to the cache before it is sent, thus even the first download has a
+            # length and can be resumed with range requests. An interrupted download doesn't interrupt the build.
+            def write_archive(path):
+                with open(path, 'wb') as archive_file:
+                    for data in ZipStream(members, compression_level):
+                        archive_file.write(data)
+            archive_path, temporary = archive_cache.build(fingerprint, write_archive)
+            response = FileResponseHandler.file_response(request, archive_path, content_type='application/zip',
+                                                         temporary=temporary)
+        response.content_disposition = content_disposition
+        response.etag = fingerprint
+        response.conditional_response = True
+        return response
@@ -0,0 +1,131 @@
+import logging
+import os
+import tempfile
+import threading
+
+
+class DiskCache:
+    """
+    Disk cache of generated files (archives, reports, thumbnails, indices of csv files etc.), which are evicted
+    least recently used first as soon as the cache exceeds max_bytes. A file larger than max_bytes on its own isn't
+    cached at all.
+    """
+
+    def __init__(self, directory, max_bytes, suffix='.zip'):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        # size of the cached files, only counted by evict
+        self._total_bytes = None
+        # key -> event, which is set as soon as the file is built
+        self._building = dict()
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def get(self, key):
+        """
+        Returns the path of the cached file and marks it as recently used
+        :param key: fingerprint of the file
+        :return: path or None if the file isn't cached
+        """
+        path = os.path.join(self._directory, key + self.suffix)
+        try:
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def build(self, key, write):
+        """
+        Returns the cached file of key, it is written if it isn't cached yet. Concurrent calls for the same key wait
+        for a single build, which is finished even if the caller, e.g. the request, is gone.
+        :param key: fingerprint of the file
+        :param write: function writing the file to the path passed as argument
+        :return: tuple (path, temporary). The file is only temporary if it exceeds max_bytes on its own, in this case
+        the caller has to remove it.
+        """
+        while True:
+            cached_path = self.get(key)
+            if cached_path is not None:
+                return cached_path, False
+            with self._lock:
+                event = self._building.get(key)
+                building = event is None
+                if building:
+                    event = self._building[key] = threading.Event()
+            if not building:
+                # the file is cached by now, unless the build failed or the file is too large for the cache. In this
+                # case it is built by this thread.
+                event.wait()
+                continue
+            try:
+                handle, temppath = tempfile.mkstemp(suffix='.part', dir=self._directory)
+                os.close(handle)
+                try:
+                    write(temppath)
+                    cached_path = self.add(key, temppath)
+                except Exception:
+                    os.remove(temppath)
+                    raise
+                if cached_path is None:
+                    return temppath, True
+                return cached_path, False
+            finally:
+                with self._lock:
+                    del self._building[key]
+                event.set()
+
+    def add(self, key, path):
+        """
+        Moves a completely written file into the cache
+        :param key: fingerprint of the file
+        :param path: path of the file, has to be on the same filesystem as the cache directory
+        :return: path of the cached file or None, if the file exceeds max_bytes on its own. In this case the file
+        is left at path.
+        """
+        size = os.path.getsize(path)
+        if size > self._max_bytes:
+            return None
+        cached_path = os.path.join(self._directory, key + self.suffix)
+        os.rename(path, cached_path)
+        self._added(size)
+        return cached_path
+
+    def _added(self, size):
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += size
+            exceeded = self._total_bytes is None or self._total_bytes > self._max_bytes
+        if exceeded:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used files, until the cache doesn't exceed max_bytes
+        :return:
+        """
+        with self._lock:
+            files = []
+            for filename in os.listdir(self._directory):
+                if not filename.endswith(self.suffix):
+                    continue
+                try:
+                    file_stat = os.stat(os.path.join(self._directory, filename))
+                except OSError:
+                    continue
+                files.append((file_stat.st_mtime, file_stat.st_size, filename))
+            files.sort()
+            total = sum([cached_file[1] for cached_file in files])
+            for mtime, size, filename in files:
+                if total <= self._max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self._directory, filename))
+                    total -= size
+                except OSError as e:
+                    log = logging.getLogger(__name__)
+                    log.warning('Unable to evict the file {0}: {1}'.format(filename, e))
+            self._total_bytes = total
@@ -0,0 +1,187 @@
+import hashlib
+import mimetypes
+import os
+import urllib
+
+from pyramid.httpexceptions import HTTPNotModified
+from pyramid.response import Response
+from pyramid.settings import asbool
+from webob.static import FileIter
+
+# block size of the file iterators and the wsgi.file_wrapper
+BLOCK_SIZE = 64 * 1024
+# directory of the datasetbrowser package, its modules and templates render the views
+PACKAGE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TemporaryFileIter(FileIter):
+    """
+    Iterates over a temporary file, which is removed as soon as it is sent
+    """
+
+    def __init__(self, file, path):
+        FileIter.__init__(self, file)
+        self.path = path
+
+    def app_iter_range(self, seek=None, limit=None, block_size=BLOCK_SIZE):
+        try:
+            for data in FileIter.app_iter_range(self, seek, limit, block_size):
+                yield data
+        finally:
+            self.close()
+
+    __iter__ = app_iter_range
+
+    def close(self):
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class FileResponseHandler:
+    """
+    Validators (ETag, Last-Modified) and conditional responses for the files below the root_dir. The ETag of a file
+    is derived from its path, mtime and size, thus it is computed by a single stat call without reading the file.
+    """
+
+    @staticmethod
+    def etag(path, path_stat, variants=None):
+        """
+        :param path: path of the file
+        :param path_stat: stat result of the file
+        :param variants: list of additional values the response depends on (e.g. route and parameters of a rendered
+        view), None for the raw file
+        :return: hex digest
+        """
+        return hashlib.sha1(repr((os.path.abspath(path), path_stat.st_mtime, path_stat.st_size,
+                                  variants)).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def content_disposition(disposition, filename):
+        """
+        Content-Disposition header offering the file under filename. Besides the utf-8 filename (RFC 5987) it
+        contains an ascii fallback for older clients, in which quotes, backslashes and control characters are replaced.
+        :param disposition: 'inline' or 'attachment'
+        :param filename: name of the file, unicode or utf-8 encoded
+        :return: header value
+        """
+        if isinstance(filename, bytes):
+            filename = filename.decode('utf-8', 'replace')
+        fallback = ''.join([character if u' ' <= character < u'\x7f' and character not in u'"\\' else u'_'
+                            for character in filename])
+        return str('{0}; filename="{1}"; filename*=UTF-8\'\'{2}'.format(
+            disposition, fallback, urllib.quote(filename.encode('utf-8'), safe='')))
+
+    @staticmethod
+    def file_response(request, path, path_stat=None, content_type=None, temporary=False):
+        """
+        Returns the raw file with ETag and Last-Modified, thus revisits are answered with 304 Not Modified. Complete
+        files are passed to the wsgi.file_wrapper of the server (i.e. sendfile), while for Range requests the file
+        is seeked to the requested part instead of being read up to it.
+        :param request:
+        :param path: path of the file
+        :param path_stat: stat result of the file, if already known
+        :param content_type: content type, guessed from the filename by default
+        :param temporary: remove the file once it is sent
+        :return: response
+        """
+        if path_stat is None:
+            path_stat = os.stat(path)
+        content_encoding = None
+        if content_type is None:
+            content_type, content_encoding = mimetypes.guess_type(path, strict=False)
+            content_type = str(content_type or 'application/octet-stream')
+        response = Response(conditional_response=True, content_type=content_type,
+                            content_encoding=content_encoding)
+        response.etag = FileResponseHandler.etag(path, path_stat)
+        response.last_modified = path_stat.st_mtime
+        response.accept_ranges = 'bytes'
+
+        f = open(path, 'rb')
+        file_wrapper = request.environ.get('wsgi.file_wrapper')
+        if temporary:
+            response.app_iter = TemporaryFileIter(f, path)
+        elif file_wrapper is not None and request.range is None:
+            response.app_iter = file_wrapper(f, BLOCK_SIZE)
+        else:
+            # the webob FileIter supports app_iter_range, i.e. partial responses seek in the file
+            response.app_iter = FileIter(f)
+        response.content_length = path_stat.st_size
+        return response
+
+    @staticmethod
+    def _package_mtime():
+        """
+        :return: latest mtime of the modules and templates of the package
+        """
+        mtime = 0
+        for dirpath, dirnames, filenames in os.walk(PACKAGE_DIRECTORY):
+            for filename in filenames:
+                if not filename.endswith('.py') and not filename.endswith('.pt'):
+                    continue
+                try:
+                    mtime = max(mtime, os.stat(os.path.join(dirpath, filename)).st_mtime)
+                except OSError:
+                    pass
+        return mtime
+
+    @staticmethod
+    def render_version(request):
+        """
+        Version of the code and the templates rendering the views, thus an update invalidates the cached views. It
+        is determined once, unless the templates are reloaded.
+        :return:
+        """
+        settings = request.registry.settings
+        version = settings.get('render_version')
+        if version is None or asbool(settings.get('reload_templates', False)):
+            version = settings['render_version'] = FileResponseHandler._package_mtime()
+        return version
+
+    @staticmethod
+    def rendered_variants(request):
+        """
+        :return: the values a rendered view of a file depends on besides the file itself
+        """
+        return [request.matched_route.name if request.matched_route is not None else None,
+                sorted(request.matchdict.items()) if request.matchdict else [],
+                sorted(request.params.items()),
+                request.authenticated_userid,
+                FileResponseHandler.render_version(request)]
+
+    @staticmethod
+    def conditional(request, path, response=None):
+        """
+        Sets the validators of a view rendered from a file and checks the conditional headers of the request,
+        before the (expensive) rendering takes place. The response is marked no-cache, i.e. clients revalidate it on
+        every use instead of guessing its freshness from Last-Modified.
+        :param request:
+        :param path: path of the rendered file
+        :param response: response whose validators are set, by default request.response used by the renderers
+        :return: 304 Not Modified response if the client's copy is still valid, otherwise None
+        """
+        try:
+            path_stat = os.stat(path)
+        except OSError:
+            return None
+        response = request.response if response is None else response
+        response.etag = FileResponseHandler.etag(path, path_stat, FileResponseHandler.rendered_variants(request))
+        response.last_modified = path_stat.st_mtime
+        response.cache_control.no_cache = True
+        response.conditional_response = True
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        if request.if_none_match:
+            not_modified = response.etag in request.if_none_match
+        else:
+            not_modified = request.if_modified_since is not None and \
+                response.last_modified <= request.if_modified_since
+        if not not_modified:
+            return None
+        not_modified_response = HTTPNotModified()
+        not_modified_response.etag = response.etag
+        not_modified_response.last_modified = response.last_modified
+        not_modified_response.cache_control.no_cache = True
+        return not_modified_response
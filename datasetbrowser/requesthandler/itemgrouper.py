@@ -1,73 +1,200 @@
 import logging
-import mimetypes
 import os
 import re
 import numpy
-import sys
 from Levenshtein._levenshtein import distance
 from pyramid.renderers import render
 
+from datasetbrowser.requesthandler.directorySettingsHandler import DirectoryLoadSettings
+from datasetbrowser.requesthandler.workerPool import WorkerPool
+
+
+def _edit_distance_rows(args):
+    """
+    Computes the upper triangle of the rows [start, stop) of the edit distance matrix.
+    :param args: tuple (items, start, stop, dtype)
+    :return: flat array with the distances of row start followed by the ones of the next rows
+    """
+    items, start, stop, dtype = args
+    n = len(items)
+    distances = numpy.empty(_triangle_offset(n, stop) - _triangle_offset(n, start), dtype=dtype)
+    position = 0
+    for i in range(start, stop):
+        item_a = items[i]
+        row = [distance(item_a, item_b) for item_b in items[i + 1:]]
+        distances[position:position + len(row)] = row
+        position += len(row)
+    return distances
+
+
+def _triangle_offset(n, row):
+    """
+    Position of the first element of row in the flat upper triangle of a n x n matrix
+    """
+    return row * n - row * (row + 1) // 2
+
+
+def _group_bucket(args):
+    """
+    Groups one bucket of the approximate grouping into rows by the edit distances of its items.
+    :param args: tuple (items, elements_per_group)
+    :return: list of rows
+    """
+    items, elements_per_group = args
+    grouper = ItemGrouper()
+    # runs inside a daemonic worker, which must not use the worker pool itself
+    return grouper._group_by_distances(items, grouper._compute_edit_distances(items, parallel=False),
+                                       elements_per_group)
+
 
 class ItemGrouper:
+    # number of items from which on the edit distances are computed by the worker pool
+    parallel_threshold = 1500
+    # number of items from which on the numerical grouping falls back to the approximate grouping
+    approx_threshold = 5000
+    # maximal number of items which are compared with each other by the approximate grouping
+    approx_bucket_size = 256
+    # number of pairs which are scanned at once while grouping by distances
+    distance_block_size = 1 << 20
+
     def __init__(self):
         pass
 
     @staticmethod
-    def _compute_edit_distance_matrix(input):
+    def _compute_edit_distances(input, parallel=True):
         """
-        Computes the edit distance between the
-        :param input:
-        :return:
+        Computes the edit distance between all pairs (i, j) with i < j of the input.
+        :param input: list of strings
+        :param parallel: use the worker pool for large inputs, False if called from a worker process
+        :return: flat array of the upper triangle of the distance matrix in row-major order
         """
         assert(isinstance(input, list))
-        matrix = numpy.zeros(shape=(len(input), len(input)))
-        for i, item_a in enumerate(input):
-            for j, item_b in enumerate(input):
-                if i == j:
-                    matrix[i, j] = sys.maxint - 1000
-                else:
-                    matrix[i, j] = distance(item_a, item_b)
-        return matrix
+        n = len(input)
+        max_length = max([len(item) for item in input]) if n > 0 else 0
+        dtype = numpy.min_scalar_type(max_length)
+        pool = WorkerPool.get() if parallel and n >= ItemGrouper.parallel_threshold else None
+        if pool is None:
+            return _edit_distance_rows((input, 0, n, dtype))
 
-    def _group_by_matrix(self, input, matrix, items_per_row):
+        # split the rows into chunks containing roughly the same number of pairs
+        chunks = []
+        pairs_per_chunk = max(1, _triangle_offset(n, n) // (4 * WorkerPool.size()))
+        start = 0
+        while start < n:
+            stop = start + 1
+            while stop < n and _triangle_offset(n, stop) - _triangle_offset(n, start) < pairs_per_chunk:
+                stop += 1
+            chunks.append((input, start, stop, dtype))
+            start = stop
+        return numpy.concatenate(WorkerPool.result(pool.map_async(_edit_distance_rows, chunks)))
+
+    def _group_by_distances(self, input, distances, items_per_row):
         """
-        Groups the elements in input into rows using the weights contained in matrix.
-        :param input:
-        :param matrix:
+        Groups the elements in input into rows by greedily pairing the closest elements first. The pairs are visited
+        in the order of increasing distance (ties broken by position), a pair is skipped as soon as one of its
+        elements was part of a pair which completed a row. Elements which are not part of such a pair are added
+        in their order at the end.
+        :param input: list of strings
+        :param distances: flat upper triangle of the distance matrix, see _compute_edit_distances
         :param items_per_row:
-        :return:
+        :return: list of rows
         """
-        rows = []
-        tmp_row = []
-        minvalue = matrix.min()
-        elements_to_add = len(input)
-        # TODO: refactor this, should be more pretty
-        while minvalue != sys.maxint:
-            index = numpy.unravel_index(matrix.argmin(), matrix.shape)
-            elements = [input[index[0]], input[index[1]]]
-
-            for element in elements:
-                tmp_row.append(element)
-                elements_to_add -= 1
-                if len(tmp_row) == items_per_row:
-                    rows.append(tmp_row)
-                    tmp_row = []
-                if elements_to_add == 0 and len(tmp_row) > 0:
-                    rows.append(tmp_row)
-                    tmp_row = []
-
-            # prevent this tuple from further existing
-            matrix[index] = sys.maxint
-            matrix[index[1], index[0]] = sys.maxint
-
-            # if the row is full then we can eliminate the files, otherwise we have to leave space for 
-            if len(tmp_row) == 0:
-                matrix[index[0], :] = sys.maxint
-                matrix[index[1], :] = sys.maxint
-                matrix[:, index[0]] = sys.maxint
-                matrix[:, index[1]] = sys.maxint
-            minvalue = matrix.min()
-        return rows
+        n = len(input)
+        state = dict(rows=[], tmp_row=[], elements_to_add=n)
+
+        def add_pair(i, j):
+            for element in [input[i], input[j]]:
+                state['tmp_row'].append(element)
+                state['elements_to_add'] -= 1
+                if len(state['tmp_row']) == items_per_row:
+                    state['rows'].append(state['tmp_row'])
+                    state['tmp_row'] = []
+                if state['elements_to_add'] == 0 and len(state['tmp_row']) > 0:
+                    state['rows'].append(state['tmp_row'])
+                    state['tmp_row'] = []
+            return len(state['tmp_row']) == 0
+
+        # the pairs are visited by increasing distance, pairs with the same distance in row-major order, i.e. in the
+        # order of their flat index. Instead of sorting all pairs, the flat distances are scanned in blocks once per
+        # distance value, thus only the indices of a single block are held in memory.
+        row_offsets = _triangle_offset(n, numpy.arange(n + 1, dtype=numpy.int64))
+        block_size = self.distance_block_size
+        values = []
+        if len(distances) > 0:
+            counts = numpy.zeros(int(distances.max()) + 1, dtype=numpy.int64)
+            for block_start in range(0, len(distances), block_size):
+                counts += numpy.bincount(distances[block_start:block_start + block_size], minlength=len(counts))
+            values = numpy.flatnonzero(counts).tolist()
+        removed = numpy.zeros(n, dtype=bool)
+        removed_count = 0
+        for value in values:
+            for block_start in range(0, len(distances), block_size):
+                if removed_count == n:
+                    break
+                positions = numpy.flatnonzero(distances[block_start:block_start + block_size] == value) + block_start
+                # row and column of each flat index in the upper triangle
+                first = numpy.searchsorted(row_offsets, positions, side='right') - 1
+                second = positions - row_offsets[first] + first + 1
+                alive = ~(removed[first] | removed[second])
+                for i, j in zip(first[alive].tolist(), second[alive].tolist()):
+                    if removed[i] or removed[j]:
+                        continue
+                    if add_pair(i, j):
+                        removed_count += int(not removed[i]) + int(not removed[j])
+                        removed[i] = True
+                        removed[j] = True
+
+        # the remaining elements are paired with themselves
+        for i in range(n):
+            if not removed[i]:
+                if add_pair(i, i):
+                    removed[i] = True
+        return state['rows']
+
+    def _approximate_grouping(self, items, elements_per_group, bucket_size):
+        """
+        Groups the items in near-linear time. The items are bucketed by their pattern, i.e. the name with every
+        number replaced by 0. Buckets with neighbouring patterns are merged till they contain bucket_size items,
+        larger buckets are split alphabetically. The exact numerical grouping is only applied within each bucket.
+        :param items:
+        :param elements_per_group:
+        :param bucket_size:
+        :return: list of rows
+        """
+        patterns = dict()
+        for item in items:
+            pattern = re.sub('[0-9]+', '0', item)
+            if pattern in patterns:
+                patterns[pattern].append(item)
+            else:
+                patterns[pattern] = [item]
+
+        buckets = []
+        tmp_bucket = []
+        for pattern in sorted(patterns.keys()):
+            pattern_items = patterns[pattern]
+            if len(tmp_bucket) + len(pattern_items) > bucket_size and len(tmp_bucket) > 0:
+                buckets.append(tmp_bucket)
+                tmp_bucket = []
+            if len(pattern_items) > bucket_size:
+                pattern_items = sorted(pattern_items)
+                for i in range(0, len(pattern_items), bucket_size):
+                    buckets.append(pattern_items[i:i + bucket_size])
+                continue
+            tmp_bucket += pattern_items
+        if len(tmp_bucket) > 0:
+            buckets.append(tmp_bucket)
+
+        arguments = [(bucket, elements_per_group) for bucket in buckets]
+        pool = WorkerPool.get() if len(items) >= self.parallel_threshold else None
+        if pool is not None:
+            grouped_buckets = WorkerPool.result(pool.map_async(_group_bucket, arguments))
+        else:
+            grouped_buckets = map(_group_bucket, arguments)
+        groups = []
+        for rows in grouped_buckets:
+            groups += rows
+        return groups
 
     def _alphabetical_grouping(self, items, elements_per_group):
         """
@@ -87,77 +214,50 @@ class ItemGrouper:
             groups.append(tmp_group)
         return groups
 
-    def _reorganize_files(self, files, specific_filter_criteria=None, blacklist=None):
-        if not blacklist:
-            blacklist = []
-        if not specific_filter_criteria:
-            specific_filter_criteria = []
-
+    def _reorganize_files(self, files, compiled_settings):
+        """
+        Splits the files into hidden and visible files and groups the visible ones by the specific filter criteria
+        (e.g. regex:README.md$) or, if no criteria matches, by their file extension
+        :param files: list of filenames
+        :param compiled_settings: CompiledDirectorySettings
+        :return:
+        """
         items_dict = dict()
         visible_items = []
         invisible_items = []
 
         for file in files:
-            skip = False
-            for rule in blacklist:
-                if rule == '':
-                    continue
-                if re.search(rule, file) is not None:
-                    skip = True
-                    break
-            if skip:
+            if compiled_settings.is_blacklisted(file):
+                continue
+            if file.startswith('.'):
+                invisible_items.append(file)
                 continue
 
-            filename, file_ext = os.path.splitext(file)
-            if not file.startswith('.'):
-                visible_items.append(file)
-                handled_file = False
-                # Filter for specific filter-criteria. Enables the user to specify for example regex:README.md$
-                # as a filter criteria and define specific behaviour rules
-                for specific_criteria in specific_filter_criteria:
-                    possible_criteria_types = ['mimetype:', 'regex:']
-                    for criteria_type in possible_criteria_types:
-                        if specific_criteria.startswith(criteria_type):
-                            truncated_criteria = specific_criteria[len(criteria_type):]
-                            element_to_validate = file
-                            if criteria_type == 'mimetype:':
-                                element_to_validate = mimetypes.guess_type(file)[0]
-                                if element_to_validate is None:
-                                    continue
-                            if re.search(truncated_criteria, element_to_validate) is not None:
-                                if specific_criteria not in items_dict:
-                                    items_dict[specific_criteria] = [file]
-                                else:
-                                    items_dict[specific_criteria].append(file)
-                                handled_file = True
-                                break
-                    if handled_file:
-                        break
-                if handled_file:
-                    continue
-
+            visible_items.append(file)
+            key = compiled_settings.specific_criteria(file)
+            if key is None:
                 # Unable to handle the file by specific criteria, thus we fall back to the fileextension
-                if file_ext in items_dict:
-                    items_dict[file_ext].append(file)
-                else:
-                    items_dict[file_ext] = [file]
+                key = os.path.splitext(file)[1]
+            if key in items_dict:
+                items_dict[key].append(file)
             else:
-                invisible_items.append(file)
+                items_dict[key] = [file]
         return items_dict, visible_items, invisible_items
 
     def _apply_filter_to_items(self, items, filter, is_last_filterrule=False):
         """
         Gets a list of string items and a list of filtercriteria consisting of regular_expressions and filters them into a dictionary
         :param items: list of strings
-        :param filter: list of regular expressions
+        :param filter: regular expression, either as string or compiled
         :return: filtered dictionary
         """
-        assert (isinstance(filter, str) or isinstance(filter, unicode))
+        if isinstance(filter, str) or isinstance(filter, unicode):
+            filter = re.compile(filter)
         returning_dict = dict()
         for item in items:
-            match = re.search(filter, item)
+            match = filter.search(item)
             if match is None:
-                print('Couldn\'t group the following item, because the regex failed {0} {1}'.format(item, filter))
+                print('Couldn\'t group the following item, because the regex failed {0} {1}'.format(item, filter.pattern))
                 continue
             if match.group() in returning_dict:
                 returning_dict[match.group()].append(item)
@@ -169,7 +269,10 @@ class ItemGrouper:
         assert (len(filtercriteria) >= 1)
         returning_dict = dict()
         if isinstance(items, list):
-            returning_dict = self._apply_filter_to_items(items, str(filtercriteria[0]), len(filtercriteria) == 1)
+            filter = filtercriteria[0]
+            if not hasattr(filter, 'search'):
+                filter = str(filter)
+            returning_dict = self._apply_filter_to_items(items, filter, len(filtercriteria) == 1)
         if len(filtercriteria) == 1:
             return returning_dict
 
@@ -177,40 +280,56 @@ class ItemGrouper:
             returning_dict[key] = self._filter_to_dict(values, filtercriteria[1:])
         return returning_dict
 
-    def _split_files_into_subgroups(self, input, items_per_row, grouping_method='numerical'):
+    def _split_files_into_subgroups(self, input, items_per_row, grouping_method='numerical', approx_threshold=None,
+                                    bucket_size=None):
         assert (items_per_row >= 1)
         if isinstance(input, list):
-            return self.group(input, items_per_row, grouping_method)
+            return self.group(input, items_per_row, grouping_method, approx_threshold, bucket_size)
         elif isinstance(input, dict):
             for (key, value) in input.items():
-                input[key] = self._split_files_into_subgroups(value, items_per_row, grouping_method)
+                input[key] = self._split_files_into_subgroups(value, items_per_row, grouping_method,
+                                                              approx_threshold, bucket_size)
             return input
         else:
             print('Something went wrong. The type of the input isn\'t a dict '
                   'or a list. {0}'.format(str(type(input))))
             return input
 
-    def _group_files_by_specific_criteria(self, files, extension_specific):
+    def _group_files_by_specific_criteria(self, files, extension_specific, group_by=None):
         errors = []
         try:
-            grouped_files = self._filter_to_dict(files, extension_specific['group_by'])
+            grouped_files = self._filter_to_dict(files, group_by if group_by is not None else extension_specific['group_by'])
         except Exception as e:
             grouped_files = []
             errors.append(e.message)
         elements_per_row = extension_specific['elements_per_row']
+        approx_threshold = extension_specific.get('approx_threshold')
+        bucket_size = extension_specific.get('approx_bucket_size')
 
         if 'grouping_method' not in extension_specific:
-            row_group_files = self._split_files_into_subgroups(grouped_files, elements_per_row)
+            row_group_files = self._split_files_into_subgroups(grouped_files, elements_per_row,
+                                                               approx_threshold=approx_threshold,
+                                                               bucket_size=bucket_size)
         else:
-            row_group_files = self._split_files_into_subgroups(grouped_files, elements_per_row, extension_specific['grouping_method'])
+            row_group_files = self._split_files_into_subgroups(grouped_files, elements_per_row, extension_specific['grouping_method'],
+                                                               approx_threshold, bucket_size)
         return row_group_files, errors
 
-    def group(self, items, elements_per_group, method='numerical'):
+    def group(self, items, elements_per_group, method='numerical', approx_threshold=None, bucket_size=None):
+        if approx_threshold is None:
+            approx_threshold = self.approx_threshold
+        if bucket_size is None:
+            bucket_size = self.approx_bucket_size
+        if method == 'numerical' and len(items) > approx_threshold:
+            method = 'numerical_approx'
+
         if method == 'alphabetical':
             return self._alphabetical_grouping(items, elements_per_group)
+        elif method == 'numerical_approx':
+            return self._approximate_grouping(items, elements_per_group, bucket_size)
         elif method == 'numerical':
-            matrix = self._compute_edit_distance_matrix(items)
-            groups = self._group_by_matrix(items, matrix, elements_per_group)
+            distances = self._compute_edit_distances(items)
+            groups = self._group_by_distances(items, distances, elements_per_group)
             return groups
         else:
             return items
@@ -246,19 +365,74 @@ class ItemGrouper:
                 tree[key] = _convert_list_to_listdict(value, filespecific_updates)
         return tree
 
+    def paginate(self, tree, offset, limit=None):
+        """
+        Returns a copy of the grouped files, which only contains the rows [offset, offset + limit). The rows are
+        counted in the order in which they are displayed, i.e. with sorted keys.
+        :param tree: grouped files as returned by group_folder for a specific filetemplate
+        :param offset: index of the first row
+        :param limit: maximal number of rows, None returns all rows
+        :return: (copy of the tree, total number of rows in the tree)
+        """
+        counter = dict(position=0)
+
+        def slice_rows(node):
+            if isinstance(node, dict):
+                sliced = dict()
+                for key in sorted(node.keys()):
+                    value = slice_rows(node[key])
+                    if len(value) > 0:
+                        sliced[key] = value
+                return sliced
+            elif isinstance(node, list):
+                rows = []
+                for row in node:
+                    position = counter['position']
+                    if position >= offset and (limit is None or position < offset + limit):
+                        rows.append(list(row) if isinstance(row, list) else row)
+                    counter['position'] += 1
+                return rows
+            return node
+
+        sliced_tree = slice_rows(tree)
+        return sliced_tree, counter['position']
+
+    def first_group(self, tree):
+        """
+        Returns the keys leading to the first row of the grouped files, in the order in which they are displayed
+        :param tree:
+        :return: list of keys
+        """
+        path = []
+        while isinstance(tree, dict) and len(tree) > 0:
+            key = sorted(tree.keys())[0]
+            path.append(key)
+            tree = tree[key]
+        return path
+
+    def leaf_items(self, tree):
+        """
+        Returns all filenames contained in the grouped files
+        :param tree:
+        :return: list of filenames
+        """
+        if isinstance(tree, dict):
+            items = []
+            for value in tree.values():
+                items += self.leaf_items(value)
+            return items
+        elif isinstance(tree, list):
+            items = []
+            for value in tree:
+                items += self.leaf_items(value)
+            return items
+        return [tree]
+
     def group_folder(self, files, directory_settings):
         # restructure files and split them according to their fileextension
-        blacklist = None
-        special_filter_criteria = None
-        if 'blacklist' in directory_settings:
-            blacklist = directory_settings['blacklist']
-        if 'specific_filetemplates' in directory_settings:
-            spec_ft = directory_settings['specific_filetemplates']
-            if isinstance(spec_ft, dict):
-                special_filter_criteria = spec_ft.keys()
-
+        compiled_settings = DirectoryLoadSettings.compiled_settings(directory_settings)
         visible_items_by_extension, visible_items, invisible_items = \
-            self._reorganize_files(files, special_filter_criteria, blacklist)
+            self._reorganize_files(files, compiled_settings)
 
         visible_items_by_extension['..'] = ['..']
 
@@ -268,7 +442,26 @@ class ItemGrouper:
                 continue
             if extension in directory_settings['specific_filetemplates']:
                 extension_specific = directory_settings['specific_filetemplates'][extension]
-                groupedfiles, errors = self._group_files_by_specific_criteria(filenames, extension_specific)
+                groupedfiles, errors = self._group_files_by_specific_criteria(filenames, extension_specific,
+                                                                              compiled_settings.group_by.get(extension))
                 visible_items_by_extension[extension] = groupedfiles
 
         return visible_items_by_extension, visible_items, invisible_items
+
+    def cached_group_folder(self, grouping_cache, folder, files, directory_settings, fingerprint):
+        """
+        Groups the folder content like group_folder. The result is reused as long as the fingerprint of the folder
+        (see DirectoryRequestHandler.fingerprint) is unchanged, it is shared and must not be modified.
+        :param grouping_cache: LRUCache folder -> (fingerprint, grouping)
+        :param folder: path of the folder
+        :param files: names of the folder content
+        :param directory_settings:
+        :param fingerprint: fingerprint of the folder content and its settings
+        :return: see group_folder
+        """
+        cached_grouping = grouping_cache.get(folder)
+        if cached_grouping is not None and cached_grouping[0] == fingerprint:
+            return cached_grouping[1]
+        grouping = self.group_folder(files, directory_settings)
+        grouping_cache.set(folder, (fingerprint, grouping))
+        return grouping
@@ -1,16 +1,35 @@
+import hashlib
 import logging
 import mimetypes
 import os
 import re
 
+from datasetbrowser.requesthandler.cacheHandler import LRUCache
+from datasetbrowser.requesthandler.directoryListing import DirectoryListing
+from datasetbrowser.requesthandler.directoryRequestHandler import DirectoryRequestHandler
+from datasetbrowser.requesthandler.directorySettingsHandler import DirectoryLoadSettings
 from datasetbrowser.requesthandler.itemgrouper import ItemGrouper
+from datasetbrowser.requesthandler.thumbnailHandler import ThumbnailHandler
 
 
 class MarkdownExport:
-    def __init__(self, request):
+    # markdown of the exported subtrees, see _cached_section
+    _section_cache = LRUCache(1024)
+
+    def __init__(self, request, grouping_cache=None):
+        """
+        :param request: request the export is created for, None if it is exported outside of a request
+        :param grouping_cache: cache of the grouped folders, by default the one of the request's registry
+        """
         self._request = request
+        if grouping_cache is None and request is not None:
+            grouping_cache = request.registry.settings.get('directory_grouping_cache')
+        self._grouping_cache = grouping_cache
         self._log = logging.getLogger(__name__)
         self._folder = None
+        self._listing = set()
+        # filename -> ListingEntry of the exported folder
+        self._entries = dict()
 
     def _markdown_table(self, items):
         assert (isinstance(items, list))
@@ -27,8 +46,10 @@ class MarkdownExport:
         return output
 
     def _iterate_folder(self, menustring, items):
+        """
+        Generates the markdown of the items piece by piece
+        """
         if isinstance(items, list):
-            output = ''
             for item in items:
                 if isinstance(item, list):
                     # implement specific behaviour for some files
@@ -36,55 +57,117 @@ class MarkdownExport:
                     if isinstance(firstitem, unicode) or isinstance(firstitem, str):
                         filemime = mimetypes.guess_type(firstitem)
                         if re.match('^image', filemime[0]):
-                            output += self._markdown_table(item)
+                            yield self._markdown_table(item)
                         else:
-                            output += self._iterate_folder('#' + menustring, item)
+                            for piece in self._iterate_folder('#' + menustring, item):
+                                yield piece
                     else:
-                        output += self._iterate_folder('#' + menustring, item)
+                        for piece in self._iterate_folder('#' + menustring, item):
+                            yield piece
                 else:
-                    output += '{0} {1}\n'.format('*', item)
-            output += '\n'
-            return output
+                    yield '{0} {1}\n'.format('*', item)
+            yield '\n'
         elif isinstance(items, dict):
-            output = ''
             for (key, values) in sorted(items.items()):
-                output += '{0} {1}\n'.format(menustring, key)
-                output += self._iterate_folder('#' + menustring, values)
-            return output
+                yield self._cached_section(menustring, key, values)
         else:
             self._log.warning('Something went wrong. The type {0} is unexpected'.format(str(type(items))))
-            return ''
 
-    def export_folder(self, folder, directory_settings=None, filter=None):
-        # get the directory content
-        # relative_path = os.path.join(
-        #     self._request.registry.settings['root_dir'],
-        #     self._request.matchdict['dir'])
+    def _section(self, menustring, key, values):
+        """
+        Generates the markdown of the subtree key
+        """
+        yield '{0} {1}\n'.format(menustring, key)
+        for piece in self._iterate_folder('#' + menustring, values):
+            yield piece
+
+    def _section_signature(self, key):
+        """
+        :return: state of additional files the section of key depends on
+        """
+        return None
+
+    def _cached_section(self, menustring, key, values):
+        """
+        Returns the markdown of the subtree key. It is only generated again if the subtree or the files it depends
+        on changed.
+        """
+        section_key = hashlib.sha1(repr((type(self).__name__, self._folder, menustring, key, values,
+                                         self._items_signature(values),
+                                         self._section_signature(key))).encode('utf-8')).hexdigest()
+        section = MarkdownExport._section_cache.get(section_key)
+        if section is None:
+            section = ''.join(self._section(menustring, key, values))
+            MarkdownExport._section_cache.set(section_key, section)
+        return section
+
+    def _file_signature(self, filename):
+        """
+        :return: tuple (mtime, size) of a file of the exported folder, None if it doesn't exist
+        """
+        entry = self._entries.get(filename)
+        if entry is None:
+            return None
+        return entry.mtime, entry.size
+
+    def _items_signature(self, items):
+        """
+        :return: list of the signatures of the files in the subtree items, in the order of the subtree
+        """
+        if isinstance(items, dict):
+            return [self._items_signature(values) for key, values in sorted(items.items())]
+        if isinstance(items, list):
+            return [self._items_signature(item) for item in items]
+        return self._file_signature(items)
+
+    def _group_folder(self, relative_path, entries, listing, directory_settings):
+        itemgrouper = ItemGrouper()
+        grouping_cache = self._grouping_cache
+        if grouping_cache is None:
+            return itemgrouper.group_folder(listing, directory_settings)
+        grouping_fingerprint = DirectoryRequestHandler.fingerprint(
+            entries, [DirectoryLoadSettings.settings_version(directory_settings)])
+        return itemgrouper.cached_group_folder(grouping_cache, relative_path, listing, directory_settings,
+                                               grouping_fingerprint)
+
+    def iter_export(self, folder, directory_settings=None, filter=None):
+        """
+        Generates the markdown export of the folder section by section
+        :param folder: path of the folder
+        :param directory_settings:
+        :param filter: only export the files of this specific file extension
+        :return: generator of markdown strings
+        """
         self._folder = folder
         relative_path = folder
-        listing = os.listdir(relative_path)
+        entries = DirectoryListing.list(relative_path)
+        listing = DirectoryListing.names(entries)
+        self._listing = set(listing)
+        self._entries = dict([(entry.name, entry) for entry in entries])
         relative_path = str(os.path.abspath(relative_path)).encode('string-escape')
         relative_path = relative_path.decode('string-escape')
 
         # filter the folder content
-        itemgrouper = ItemGrouper()
-        visible_items_by_extension, visibleitems, invisibleitems = itemgrouper.group_folder(listing, directory_settings)
+        visible_items_by_extension, visibleitems, invisibleitems = self._group_folder(relative_path, entries, listing,
+                                                                                      directory_settings)
 
         # filter the specific file extension
         if filter is not None:
             if filter in visible_items_by_extension:
                 visible_items_by_extension = visible_items_by_extension[filter]
 
-        output = ''
-        if os.path.exists(relative_path + '/.intro.md'):
+        if '.intro.md' in listing:
             with open(relative_path + '/.intro.md') as file:
-                output += file.read()
+                yield file.read()
         # iterate through the file
-        output += self._iterate_folder('#', visible_items_by_extension)
-        if os.path.exists(relative_path + '/.outro.md'):
+        for piece in self._iterate_folder('#', visible_items_by_extension):
+            yield piece
+        if '.outro.md' in listing:
             with open(relative_path + '/.outro.md') as file:
-                output += file.read()
-        return output
+                yield file.read()
+
+    def export_folder(self, folder, directory_settings=None, filter=None):
+        return ''.join(self.iter_export(folder, directory_settings, filter))
 
 
 class PresentationMarkdownExport(MarkdownExport):
@@ -94,11 +177,11 @@ class PresentationMarkdownExport(MarkdownExport):
     def _load_key_specific_comment(self, key):
         output = ''
         keyspecificcommentfile = self._folder + '/.{0}.md'.format(key)
-        if os.path.exists(keyspecificcommentfile):
+        if '.{0}.md'.format(key) in self._listing:
             with open(keyspecificcommentfile) as commentfile:
                 output += commentfile.read()
                 output += '\n---\n\n'
-        elif os.path.exists(self._folder + '/.notes.md'):
+        elif '.notes.md' in self._listing:
             # TODO: put this into one regular expression and make it possible to specify this regex externally
             with open(self._folder + '/.notes.md') as file:
                 filecontent = file.read()
@@ -114,9 +197,46 @@ class PresentationMarkdownExport(MarkdownExport):
                         output += '---\n'
         return output
 
+    def _section_signature(self, key):
+        return self._file_signature('.{0}.md'.format(key)), self._file_signature('.notes.md'), \
+            self._thumbnail_options()
+
+    def _thumbnail_options(self):
+        """
+        :return: tuple (application path, folder relative to the root_dir, thumbnail size) the image urls are
+        created from, None if the original images are shown
+        """
+        if self._request is None or 'dir' not in self._request.matchdict:
+            return None
+        thumbnail_size = int(self._request.registry.settings.get('thumbnail.presentation_size', 1024))
+        if thumbnail_size <= 0:
+            return None
+        return self._request.script_name, self._request.matchdict['dir'], thumbnail_size
+
+    def _image_source(self, item):
+        """
+        Images are shown as thumbnails of thumbnail.presentation_size (0 shows the original images)
+        :param item: filename of the image
+        :return: url of the image
+        """
+        thumbnail_options = self._thumbnail_options()
+        if thumbnail_options is None:
+            return item
+        script_name, directory, thumbnail_size = thumbnail_options
+        thumbnail_url = ThumbnailHandler.thumbnail_url(self._request, directory + item, thumbnail_size)
+        return thumbnail_url if thumbnail_url is not None else item
+
+    def _section(self, menustring, key, values):
+        yield self._load_key_specific_comment(key)
+        yield '{0} {1}\n'.format(menustring, key)
+        if len(menustring) == 1 and isinstance(values, dict):
+            yield '---\n'
+        for piece in self._iterate_folder('#' + menustring, values, key):
+            yield piece
+        yield '---\n\n'
+
     def _iterate_folder(self, menustring, items, lastkey = ''):
         if isinstance(items, list):
-            output = ''
             expected_items = None
             for i, item in enumerate(items):
                 if isinstance(item, list):
@@ -130,31 +250,23 @@ class PresentationMarkdownExport(MarkdownExport):
                         # implement specific behaviour for some files
                         filemime = mimetypes.guess_type(firstitem)
                         if re.match('^image', filemime[0]):
-                            output += self._markdown_table(item, expected_items)
+                            yield self._markdown_table(item, expected_items)
                             if i + 1 < len(items):
-                                output += '---\n\n'
-                                output += '{0} {1}\n'.format(menustring[1:], lastkey)
+                                yield '---\n\n'
+                                yield '{0} {1}\n'.format(menustring[1:], lastkey)
                             continue
-                    output += self._iterate_folder('#' + menustring, item, lastkey)
+                    for piece in self._iterate_folder('#' + menustring, item, lastkey):
+                        yield piece
                 elif isinstance(item, unicode) or isinstance(item, str):
-                    output += '{0} {1}\n'.format('*', item, lastkey)
+                    yield '{0} {1}\n'.format('*', item, lastkey)
                 else:
                     print('The type is unknown {0}'.format(str(type(item))))
-            output += '\n'
-            return output
+            yield '\n'
         elif isinstance(items, dict):
-            output = ''
             for (key, values) in sorted(items.items()):
-                output += self._load_key_specific_comment(key)
-                output += '{0} {1}\n'.format(menustring, key)
-                if len(menustring) == 1 and isinstance(values, dict):
-                    output += '---\n'
-                output += self._iterate_folder('#' + menustring, values, key)
-                output += '---\n\n'
-            return output
+                yield self._cached_section(menustring, key, values)
         else:
             print('Something went wrong. The type {0} is unexpected. {1}'.format(str(type(items)), str(items)))
-            return ''
 
     def _markdown_table(self, items, expected_items):
         assert (isinstance(items, list))
@@ -179,7 +291,7 @@ class PresentationMarkdownExport(MarkdownExport):
         output += '\n|'
         for item in items:
             imagewidthhack = int((len(items) / float(expected_items)) * 100)
-            output += '<img src="{0}" width="{1}%"/>|'.format(item, imagewidthhack)
+            output += '<img src="{0}" width="{1}%"/>|'.format(self._image_source(item), imagewidthhack)
         if len(items) < expected_items:
             for i in range(0, expected_items - len(items)):
                 output += '|'
@@ -0,0 +1,105 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from datasetbrowser.requesthandler.cacheHandler import LRUCache
+
+
+class ReportJobQueue:
+    """
+    Runs the export of reports in a bounded number of background threads. Every job renders into its own temporary
+    directory, the results are kept in a disk cache keyed by the fingerprint of the exported folder. Thus a report
+    is only rendered once, as long as the folder doesn't change.
+    """
+
+    def __init__(self, result_cache, workers=2, max_jobs=256):
+        """
+        :param result_cache: DiskCache storing the rendered reports
+        :param workers: number of reports rendered concurrently
+        :param max_jobs: number of job states, which are kept to be queried
+        """
+        self._result_cache = result_cache
+        self._workers = workers
+        self._jobs = LRUCache(max_jobs)
+        self._active = dict()
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start_workers(self):
+        while len(self._threads) < self._workers:
+            thread = threading.Thread(target=self._work, name='ReportJobWorker-{0}'.format(len(self._threads)))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        log = logging.getLogger(__name__)
+        while True:
+            job, render = self._queue.get()
+            job['status'] = 'running'
+            job_directory = tempfile.mkdtemp(prefix='job-', dir=self._result_cache.directory)
+            try:
+                output_path = os.path.join(job_directory, 'result' + self._result_cache.suffix)
+                render(output_path)
+                job['path'] = self._result_cache.add(job['key'], output_path)
+                if job['path'] is None:
+                    raise ValueError('the report exceeds the size of the result cache')
+                job['status'] = 'done'
+            except Exception as e:
+                log.error('Report job {0} failed: {1}'.format(job['id'], e))
+                job['error'] = str(e)
+                job['status'] = 'failed'
+            finally:
+                shutil.rmtree(job_directory, ignore_errors=True)
+                with self._lock:
+                    self._active.pop(job['key'], None)
+                job['finished'] = time.time()
+
+    def submit(self, key, render, filename=None):
+        """
+        Returns the job, which provides the result for key. A job is only queued if the result isn't cached and
+        no job for the same key is queued or running.
+        :param key: fingerprint of the exported content
+        :param render: function, which writes the result to the path passed as argument
+        :param filename: name of the result offered for download
+        :return: job dictionary
+        """
+        with self._lock:
+            if key in self._active:
+                job = self._jobs.get(self._active[key])
+                if job is not None:
+                    return job
+            job = dict(id=uuid.uuid4().hex, key=key, filename=filename, status='queued', error=None, path=None,
+                       created=time.time(), finished=None)
+            cached_path = self._result_cache.get(key)
+            if cached_path is not None:
+                job['status'] = 'done'
+                job['path'] = cached_path
+                job['finished'] = job['created']
+            else:
+                self._active[key] = job['id']
+                self._start_workers()
+                self._queue.put((job, render))
+            self._jobs.set(job['id'], job)
+        return job
+
+    def job(self, job_id):
+        """
+        :param job_id:
+        :return: job dictionary or None if the job is unknown
+        """
+        job = self._jobs.get(job_id)
+        if job is not None and job['status'] == 'done' and not os.path.exists(job['path']):
+            # the result has been evicted in the meantime
+            job = dict(job, status='expired', path=None)
+        return job
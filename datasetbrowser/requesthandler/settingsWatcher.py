@@ -0,0 +1,118 @@
+import logging
+import os
+import threading
+import time
+
+from datasetbrowser.requesthandler.directorySettingsHandler import DirectoryLoadSettings
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+
+class _SettingsEventHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self._watcher = watcher
+
+    def on_any_event(self, event):
+        for path in (getattr(event, 'src_path', None), getattr(event, 'dest_path', None)):
+            if path and os.path.basename(path) == SettingsWatcher.filename:
+                self._watcher.changed(os.path.dirname(path))
+
+
+class SettingsWatcher:
+    """
+    Invalidates the memoized directory settings as soon as a .settings.json is created, changed or removed. Uses
+    filesystem notifications (inotify etc.) if watchdog is installed, otherwise the settings files of all resolved
+    folders are polled for changed mtime and size at most once per poll_interval.
+    """
+    filename = '.settings.json'
+
+    def __init__(self, directory_settings, poll_interval=1.0):
+        self._directory_settings = directory_settings
+        self._poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._watched = dict()
+        # folder -> watch of the observer, kept when the settings of the folder are invalidated
+        self._watches = dict()
+        self._last_poll = time.time()
+        self._observer = None
+        if Observer is not None:
+            try:
+                self._observer = Observer()
+                self._observer.daemon = True
+                self._observer.start()
+            except Exception as e:
+                log = logging.getLogger(__name__)
+                log.warning('Unable to start the file watcher, falling back to polling: {0}'.format(e))
+                self._observer = None
+
+    @staticmethod
+    def _signature(path):
+        try:
+            path_stat = os.stat(path)
+        except OSError:
+            return None
+        return path_stat.st_mtime, path_stat.st_size
+
+    def watch(self, folder):
+        """
+        Registers a folder whose settings were resolved
+        :param folder: absolute path of the folder
+        :return:
+        """
+        settings_path = os.path.join(folder, self.filename)
+        with self._lock:
+            if settings_path in self._watched:
+                return
+            self._watched[settings_path] = self._signature(settings_path) if self._observer is None else None
+            if self._observer is None or folder in self._watches:
+                return
+            # reserved while scheduling, thus the folder is only scheduled once
+            self._watches[folder] = None
+        try:
+            observed_watch = self._observer.schedule(_SettingsEventHandler(self), folder, recursive=False)
+        except Exception as e:
+            log = logging.getLogger(__name__)
+            log.warning('Unable to watch {0}: {1}'.format(folder, e))
+            observed_watch = None
+        with self._lock:
+            if observed_watch is None:
+                del self._watches[folder]
+            else:
+                self._watches[folder] = observed_watch
+
+    def changed(self, folder):
+        """
+        Invalidates the settings of a folder and its subfolders. Their watches of the observer are kept, only the
+        polled signatures are reset.
+        :param folder: absolute path of the folder
+        :return:
+        """
+        with self._lock:
+            for settings_path in list(self._watched.keys()):
+                if settings_path == os.path.join(folder, self.filename) or \
+                        settings_path.startswith(os.path.join(folder, '')):
+                    del self._watched[settings_path]
+        DirectoryLoadSettings.invalidate(self._directory_settings, folder)
+
+    def check(self):
+        """
+        Polls the watched settings files, if no filesystem notifications are available. Called on every request,
+        but only stats the files once per poll_interval.
+        :return:
+        """
+        if self._observer is not None:
+            return
+        now = time.time()
+        with self._lock:
+            if now - self._last_poll < self._poll_interval:
+                return
+            self._last_poll = now
+            watched = list(self._watched.items())
+        for settings_path, signature in watched:
+            if self._signature(settings_path) != signature:
+                self.changed(os.path.dirname(settings_path))
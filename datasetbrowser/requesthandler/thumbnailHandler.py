@@ -0,0 +1,138 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+import time
+
+from datasetbrowser.requesthandler.workerPool import WorkerPool
+
+
+def _create_thumbnail(args):
+    """
+    Writes a png thumbnail, which fits into a square of size pixels, using PIL or else matplotlib.
+    :param args: tuple (path of the image, path of the thumbnail, size)
+    :return:
+    """
+    source, target, size = args
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    if Image is not None:
+        image = Image.open(source)
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA')
+        image.thumbnail((size, size), Image.ANTIALIAS)
+        image.save(target, 'PNG', optimize=True)
+        return
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.image
+    height, width = matplotlib.image.imread(source).shape[:2]
+    matplotlib.image.thumbnail(source, target, scale=min(1.0, float(size) / max(height, width)))
+
+
+class ThumbnailHandler:
+    """
+    Creates the thumbnails of images in the worker pool and keeps them in a content addressed disk cache, i.e. the
+    key of a thumbnail is derived from path, mtime and size of the image and the thumbnail size.
+    """
+    min_size = 16
+    max_size = 2048
+    supported_mimetypes = {'image/bmp', 'image/gif', 'image/jpeg', 'image/png', 'image/tiff', 'image/x-ms-bmp'}
+
+    def __init__(self, cache):
+        """
+        :param cache: DiskCache storing the thumbnails
+        """
+        self._cache = cache
+
+    @staticmethod
+    def supports(filename):
+        return mimetypes.guess_type(filename)[0] in ThumbnailHandler.supported_mimetypes
+
+    @staticmethod
+    def thumbnail_url(request, relative_filename, size):
+        """
+        :param request:
+        :param relative_filename: path of the image relative to the root_dir
+        :param size: edge length of the thumbnail
+        :return: url path of the thumbnail or None, if no thumbnail can be created for this file
+        """
+        if not ThumbnailHandler.supports(relative_filename):
+            return None
+        return request.route_path('thumbnail', size=size,
+                                  subpath=tuple([part for part in relative_filename.split('/') if part]))
+
+    @staticmethod
+    def thumbnail_key(path, size):
+        """
+        :param path: path of the image
+        :param size: edge length of the thumbnail
+        :return: key of the thumbnail, None if the image doesn't exist
+        """
+        try:
+            image_stat = os.stat(path)
+        except OSError:
+            return None
+        return hashlib.sha1(repr((os.path.abspath(path), image_stat.st_mtime, image_stat.st_size,
+                                  size)).encode('utf-8')).hexdigest()
+
+    def thumbnail(self, path, size):
+        """
+        Returns the thumbnail of an image, it is created if it isn't cached yet
+        :param path: path of the image
+        :param size: edge length of the square, which contains the thumbnail
+        :return: tuple (path of the thumbnail, key) or (None, None) if the image doesn't exist or can't be read
+        """
+        return self.thumbnails([path], size)[path]
+
+    def thumbnails(self, paths, size):
+        """
+        Returns the thumbnails of several images, the missing ones are created concurrently by the worker pool
+        :param paths: paths of the images
+        :param size: edge length of the square, which contains the thumbnail
+        :return: dictionary path -> (path of the thumbnail, key), see thumbnail
+        """
+        results = dict()
+        missing = dict()
+        for path in paths:
+            if path in results or path in missing:
+                continue
+            key = ThumbnailHandler.thumbnail_key(path, size)
+            cached_path = self._cache.get(key) if key is not None else None
+            if key is None or cached_path is not None:
+                results[path] = (cached_path, key if cached_path is not None else None)
+            else:
+                missing[path] = key
+        if len(missing) == 0:
+            return results
+
+        pool = WorkerPool.get()
+        started = time.time()
+        pending = []
+        for path, key in missing.items():
+            handle, temppath = tempfile.mkstemp(suffix='.part', dir=self._cache.directory)
+            os.close(handle)
+            arguments = (path, temppath, size)
+            pending.append((path, key, temppath,
+                            pool.apply_async(_create_thumbnail, (arguments,)) if pool is not None else arguments))
+        for path, key, temppath, task in pending:
+            try:
+                if pool is not None:
+                    WorkerPool.result(task, started)
+                else:
+                    _create_thumbnail(task)
+                cached_path = self._cache.add(key, temppath)
+                if cached_path is None:
+                    raise ValueError('the thumbnail exceeds the size of the cache')
+                results[path] = (cached_path, key)
+            except Exception as e:
+                log = logging.getLogger(__name__)
+                log.warning('Unable to create the thumbnail of {0}: {1}'.format(path, e))
+                results[path] = (None, None)
+            finally:
+                if os.path.exists(temppath):
+                    os.remove(temppath)
+        return results
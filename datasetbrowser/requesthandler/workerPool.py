@@ -0,0 +1,58 @@
+import logging
+import multiprocessing
+import threading
+import time
+
+
+class WorkerPool:
+    """
+    Process pool shared by all request handlers for CPU bound work. The pool is started by main() before any thread
+    exists, since forking a multithreaded process only copies the forking thread into the workers, while the locks
+    held by other threads stay locked there. Without main() (e.g. in tests) it is started on first use.
+    """
+    processes = None
+    # seconds a request waits for the results of the workers, e.g. if a worker died while processing a task
+    timeout = 300
+    _pool = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, settings):
+        if 'worker_pool.processes' in settings:
+            cls.processes = int(settings['worker_pool.processes'])
+        if 'worker_pool.timeout' in settings:
+            cls.timeout = float(settings['worker_pool.timeout'])
+
+    @classmethod
+    def get(cls):
+        """
+        Returns the process pool or None if no worker processes can be started on this system
+        :return:
+        """
+        with cls._lock:
+            if cls._pool is None:
+                try:
+                    cls._pool = multiprocessing.Pool(cls.processes)
+                except (OSError, ImportError) as e:
+                    log = logging.getLogger(__name__)
+                    log.warning('Unable to start the worker pool, falling back to serial processing: {0}'.format(e))
+                    return None
+            return cls._pool
+
+    @classmethod
+    def result(cls, async_result, started=None):
+        """
+        Waits for the result of a task of the pool
+        :param async_result: AsyncResult returned by apply_async or map_async
+        :param started: time.time() when the task was submitted, tasks submitted together share the timeout
+        :return: result of the task
+        :raises multiprocessing.TimeoutError: if the result isn't ready within timeout seconds
+        """
+        timeout = cls.timeout
+        if started is not None:
+            timeout = max(0, started + cls.timeout - time.time())
+        return async_result.get(timeout)
+
+    @classmethod
+    def size(cls):
+        return cls.processes if cls.processes is not None else multiprocessing.cpu_count()
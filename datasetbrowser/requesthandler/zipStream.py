@@ -0,0 +1,247 @@
+import mimetypes
+import os
+import struct
+import time
+import zlib
+from collections import deque
+
+from datasetbrowser.requesthandler.workerPool import WorkerPool
+
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_MAX_ENTRIES = 0xFFFF
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+
+def _deflate_chunk(args):
+    """
+    Compresses a chunk of a member to sync flushed raw deflate blocks, which concatenate with those of other chunks.
+    :param args: tuple (data, compression level)
+    :return: compressed data
+    """
+    data, level = args
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+# empty final deflate block, terminating the sync flushed chunks of a member
+_DEFLATE_END = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS).flush(zlib.Z_FINISH)
+
+
+class ZipStream:
+    """
+    Writes a zip archive while it is iterated, thus it can directly be used as app_iter of a response. Every member
+    is read once in chunks, so neither the archive nor one of its members is ever kept completely in memory. The sizes
+    and crc of each member are written in a data descriptor following its data.
+
+    Members are only deflated if they are expected to compress, i.e. by their mimetype or the compression ratio of
+    a sample. The chunks of deflated members are compressed by the worker pool, while at most a few chunks per worker
+    are pending.
+    """
+    chunk_size = 256 * 1024
+    sample_size = 64 * 1024
+    # a sample has to shrink at least to this ratio, such that the member is deflated
+    sample_ratio = 0.9
+    stored_mimetypes = {'application/gzip', 'application/pdf', 'application/x-7z-compressed',
+                        'application/x-bzip2', 'application/x-gzip', 'application/x-rar-compressed',
+                        'application/x-xz', 'application/zip', 'image/gif', 'image/jpeg', 'image/png', 'image/webp'}
+    deflated_mimetypes = {'application/javascript', 'application/json', 'application/xml', 'image/svg+xml'}
+
+    def __init__(self, members, compression_level=6):
+        """
+        :param members: iterable of (path of the local file, name in the archive)
+        :param compression_level: zlib compression level, 0 stores all members uncompressed
+        """
+        self._members = members
+        self._compression_level = compression_level
+        self._offset = 0
+        self._central_directory = []
+
+    @staticmethod
+    def _dos_date_time(timestamp):
+        date_time = time.localtime(timestamp)
+        if date_time.tm_year < 1980:
+            return 0, (1 << 5) | 1
+        dos_time = (date_time.tm_hour << 11) | (date_time.tm_min << 5) | (date_time.tm_sec // 2)
+        dos_date = ((date_time.tm_year - 1980) << 9) | (date_time.tm_mon << 5) | date_time.tm_mday
+        return dos_time, dos_date
+
+    @staticmethod
+    def _encode_arcname(arcname):
+        """
+        Normalizes the name like ZipFile.write does and encodes it, non-ascii names are stored as utf-8
+        :return: tuple of encoded name and flag bits
+        """
+        arcname = os.path.normpath(os.path.splitdrive(arcname)[1])
+        while arcname[0] in (os.sep, os.altsep):
+            arcname = arcname[1:]
+        arcname = arcname.replace(os.sep, '/')
+        if isinstance(arcname, bytes):
+            return arcname, 0
+        try:
+            return arcname.encode('ascii'), 0
+        except UnicodeEncodeError:
+            return arcname.encode('utf-8'), 0x800
+
+    def _compress_type(self, localpath, sample):
+        """
+        Decides whether a member is deflated
+        :param localpath: path of the member
+        :param sample: first bytes of the member
+        :return: ZIP_STORED or ZIP_DEFLATED
+        """
+        if self._compression_level == 0 or not sample:
+            return ZIP_STORED
+        mimetype, encoding = mimetypes.guess_type(localpath)
+        if encoding is not None or mimetype in self.stored_mimetypes:
+            return ZIP_STORED
+        if mimetype is not None:
+            if mimetype.startswith('video/') or mimetype.startswith('audio/'):
+                return ZIP_STORED
+            if mimetype.startswith('text/') or mimetype in self.deflated_mimetypes:
+                return ZIP_DEFLATED
+        compressed_sample = zlib.compress(sample, 1)
+        if len(compressed_sample) <= self.sample_ratio * len(sample):
+            return ZIP_DEFLATED
+        return ZIP_STORED
+
+    def _header(self, member):
+        def header():
+            member['offset'] = self._offset
+            name = member['name']
+            version = 45 if member['zip64'] else 20
+            # sizes and crc follow in the data descriptor
+            crc, size, compressed_size = 0, 0, 0
+            if member['zip64']:
+                extra = struct.pack('<HHQQ', 1, 16, size, compressed_size)
+                size, compressed_size = 0xFFFFFFFF, 0xFFFFFFFF
+            else:
+                extra = b''
+            return struct.pack('<4sHHHHHLLLHH', b'PK\x03\x04', version, member['flags'], member['compress_type'],
+                               member['dos_time'], member['dos_date'], crc, compressed_size, size, len(name),
+                               len(extra)) + name + extra
+        return header
+
+    def _data_descriptor(self, member):
+        def data_descriptor():
+            if member['zip64']:
+                descriptor = struct.pack('<4sLQQ', b'PK\x07\x08', member['crc'], member['compressed_size'],
+                                         member['size'])
+            else:
+                descriptor = struct.pack('<4sLLL', b'PK\x07\x08', member['crc'], member['compressed_size'],
+                                         member['size'])
+            self._central_directory.append(member)
+            return descriptor
+        return data_descriptor
+
+    def _pieces(self, pool):
+        """
+        Reads the members and yields the parts of the archive in order, as tuple (part, member). A part is either
+        data, a pending result of the worker pool or a function creating the data once all previous parts are
+        written.
+        :param pool: worker pool or None to compress on this thread
+        :return:
+        """
+        for localpath, arcname in self._members:
+            try:
+                member_file = open(localpath, 'rb')
+            except (IOError, OSError):
+                continue
+            with member_file:
+                member_stat = os.fstat(member_file.fileno())
+                chunk = member_file.read(self.chunk_size)
+                name, flags = ZipStream._encode_arcname(arcname)
+                dos_time, dos_date = ZipStream._dos_date_time(member_stat.st_mtime)
+                member = dict(name=name, flags=flags, dos_time=dos_time, dos_date=dos_date,
+                              compress_type=self._compress_type(localpath, chunk[:self.sample_size]),
+                              zip64=member_stat.st_size > ZIP64_LIMIT, crc=0, size=0, compressed_size=0,
+                              external_attr=(member_stat.st_mode & 0xFFFF) << 16)
+
+                # bit 3: sizes and crc follow in the data descriptor, thus the member is only read once
+                member['flags'] |= 0x08
+                yield self._header(member), None
+                crc = 0
+                while chunk:
+                    crc = zlib.crc32(chunk, crc)
+                    member['size'] += len(chunk)
+                    if member['compress_type'] == ZIP_STORED:
+                        yield chunk, member
+                    elif pool is not None:
+                        yield pool.apply_async(_deflate_chunk, ((chunk, self._compression_level),)), member
+                    else:
+                        yield _deflate_chunk((chunk, self._compression_level)), member
+                    chunk = member_file.read(self.chunk_size)
+                member['crc'] = crc & 0xFFFFFFFF
+                if member['compress_type'] == ZIP_DEFLATED:
+                    yield _DEFLATE_END, member
+                yield self._data_descriptor(member), None
+
+    def _emit(self, piece):
+        part, member = piece
+        if callable(part):
+            data = part()
+        elif hasattr(part, 'get'):
+            data = WorkerPool.result(part)
+        else:
+            data = part
+        if member is not None:
+            member['compressed_size'] += len(data)
+        self._offset += len(data)
+        return data
+
+    def _central_directory_record(self, member):
+        size = member['size']
+        compressed_size = member['compressed_size']
+        header_offset = member['offset']
+        zip64_fields = []
+        if size > ZIP64_LIMIT:
+            zip64_fields.append(size)
+            size = 0xFFFFFFFF
+        if compressed_size > ZIP64_LIMIT:
+            zip64_fields.append(compressed_size)
+            compressed_size = 0xFFFFFFFF
+        if header_offset > ZIP64_LIMIT:
+            zip64_fields.append(header_offset)
+            header_offset = 0xFFFFFFFF
+        extra = b''
+        version = 20
+        if zip64_fields:
+            extra = struct.pack('<HH' + 'Q' * len(zip64_fields), 1, 8 * len(zip64_fields), *zip64_fields)
+            version = 45
+        name = member['name']
+        return struct.pack('<4sHHHHHHLLLHHHHHLL', b'PK\x01\x02', (3 << 8) | version, version, member['flags'],
+                           member['compress_type'], member['dos_time'], member['dos_date'], member['crc'],
+                           compressed_size, size, len(name), len(extra), 0, 0, 0, member['external_attr'],
+                           header_offset) + name + extra
+
+    def _end_of_archive(self):
+        directory_offset = self._offset
+        yield self._emit((b''.join([self._central_directory_record(member)
+                                    for member in self._central_directory]), None))
+        directory_size = self._offset - directory_offset
+        entries = len(self._central_directory)
+
+        if entries > ZIP_MAX_ENTRIES or directory_offset > ZIP64_LIMIT or directory_size > ZIP64_LIMIT:
+            zip64_end_offset = self._offset
+            yield self._emit((struct.pack('<4sQHHLLQQQQ', b'PK\x06\x06', 44, (3 << 8) | 45, 45, 0, 0, entries,
+                                          entries, directory_size, directory_offset), None))
+            yield self._emit((struct.pack('<4sLQL', b'PK\x06\x07', 0, zip64_end_offset, 1), None))
+            entries = min(entries, ZIP_MAX_ENTRIES)
+            directory_size = min(directory_size, 0xFFFFFFFF)
+            directory_offset = min(directory_offset, 0xFFFFFFFF)
+        yield self._emit((struct.pack('<4sHHHHLLH', b'PK\x05\x06', 0, 0, entries, entries, directory_size,
+                                      directory_offset, 0), None))
+
+    def __iter__(self):
+        pool = WorkerPool.get() if self._compression_level != 0 else None
+        # parts read ahead, i.e. at most this many chunks are compressed concurrently
+        window = 2 * WorkerPool.size() if pool is not None else 0
+        pending = deque()
+        for piece in self._pieces(pool):
+            pending.append(piece)
+            while len(pending) > window:
+                yield self._emit(pending.popleft())
+        while pending:
+            yield self._emit(pending.popleft())
+        for data in self._end_of_archive():
+            yield data
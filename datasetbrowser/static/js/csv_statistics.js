@@ -0,0 +1,42 @@
+// fills the statistics row below the header of a csv table, the statistics are requested if they aren't embedded
+function formatNumber(value) {
+    return value === null ? '-' : Number(value.toPrecision(6)).toString();
+}
+
+function showStatistics(row, statistics) {
+    var cells = row.find('td');
+    $.each(statistics.columns, function(i, column) {
+        if (column.count === undefined || i >= cells.length) {
+            return;
+        }
+        var text = formatNumber(column.min) + ' - ' + formatNumber(column.max) + ', mean ' +
+            formatNumber(column.mean) + ', ' + column.nan + ' NaN';
+        var histogram = column.histogram ? column.histogram.counts.join(' ') : '';
+        $(cells[i]).text(text).attr('title', 'histogram: ' + histogram);
+    });
+}
+
+// the statistics are computed in the background, as long as they aren't done 202 Accepted is returned
+function requestStatistics(row, url) {
+    $.ajax({url: url, dataType: 'json'}).done(function(statistics, textStatus, xhr) {
+        if (xhr.status === 202) {
+            setTimeout(function() {
+                requestStatistics(row, url);
+            }, 1000 * (parseInt(xhr.getResponseHeader('Retry-After'), 10) || 1));
+        } else {
+            showStatistics(row, statistics);
+        }
+    });
+}
+
+$(document).ready(function() {
+    $('tr.csv-statistics').each(function() {
+        var row = $(this);
+        var embedded = row.attr('data-statistics');
+        if (embedded) {
+            showStatistics(row, JSON.parse(embedded));
+        } else {
+            requestStatistics(row, row.attr('data-url'));
+        }
+    });
+});
@@ -0,0 +1,20 @@
+// loads the next page of a grouped file listing as soon as its placeholder gets close to the visible area
+function loadVisiblePages() {
+    $('div.lazy-page').each(function() {
+        var placeholder = $(this);
+        if (placeholder.data('loading')) {
+            return;
+        }
+        if (placeholder.offset().top > $(window).scrollTop() + 2 * $(window).height()) {
+            return;
+        }
+        placeholder.data('loading', true);
+        $.get(placeholder.attr('data-url'), function(html) {
+            placeholder.replaceWith(html);
+            loadVisiblePages();
+        });
+    });
+}
+
+$(window).on('scroll resize', loadVisiblePages);
+$(document).ready(loadVisiblePages);
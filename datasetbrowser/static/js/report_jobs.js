@@ -0,0 +1,39 @@
+// requests the pdf report of a folder, as long as it is rendered by a background job the state of the job is polled
+function pollReportJob(link, url) {
+    $.getJSON(url, function(job) {
+        if (job.status === 'done') {
+            link.removeClass('report-pending');
+            window.location = job.result;
+        } else if (job.status === 'failed' || job.status === 'expired') {
+            link.removeClass('report-pending').attr('title', 'Report ' + job.status + (job.error ? ': ' + job.error : ''));
+        } else {
+            setTimeout(function() {
+                pollReportJob(link, url);
+            }, 1000);
+        }
+    }).fail(function() {
+        link.removeClass('report-pending');
+    });
+}
+
+$(document).ready(function() {
+    $('a.report-link').click(function(event) {
+        var link = $(this);
+        event.preventDefault();
+        if (link.hasClass('report-pending')) {
+            return;
+        }
+        link.addClass('report-pending');
+        // HEAD submits the job without downloading a report, which is already done
+        $.ajax({url: link.attr('href'), type: 'HEAD'}).done(function(data, textStatus, xhr) {
+            if (xhr.status === 202) {
+                pollReportJob(link, xhr.getResponseHeader('Location'));
+            } else {
+                link.removeClass('report-pending');
+                window.location = link.attr('href');
+            }
+        }).fail(function() {
+            link.removeClass('report-pending');
+        });
+    });
+});
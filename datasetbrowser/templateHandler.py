@@ -1,3 +1,4 @@
+import hashlib
 import logging
 import math
 import os
@@ -6,14 +7,56 @@ import re
 from chameleon import PageTemplate
 from pyramid.renderers import render
 
+from datasetbrowser.requesthandler.cacheHandler import LRUCache
 from datasetbrowser.requesthandler.directoryRequestHandler import DirectoryRequestHandler
 from datasetbrowser.requesthandler.fileHandler import open_resource
 
 
 class TemplateHandler:
+    # compiled templates shared by all requests
+    _template_cache = LRUCache(256)
+
     def __init__(self):
         pass
 
+    @staticmethod
+    def configure(settings):
+        if 'template_cache.max_entries' in settings:
+            TemplateHandler._template_cache = LRUCache(int(settings['template_cache.max_entries']))
+
+    @staticmethod
+    def cache_statistics():
+        cache = TemplateHandler._template_cache
+        return dict(hits=cache.hits, misses=cache.misses, entries=len(cache))
+
+    @staticmethod
+    def compiled_template(source, **options):
+        """
+        Returns the compiled PageTemplate for the template source. Templates are cached by the hash of their source.
+        :param source: template source
+        :param options: keyword arguments passed to the PageTemplate
+        :return:
+        """
+        encoded_source = source.encode('utf-8') if isinstance(source, unicode) else source
+        key = (hashlib.sha1(encoded_source).hexdigest(), tuple(sorted(options.items())))
+        template = TemplateHandler._template_cache.get(key)
+        if template is None:
+            template = PageTemplate(source, **options)
+            TemplateHandler._template_cache.set(key, template)
+        return template
+
+    @staticmethod
+    def render_template(template_path, values, request=None):
+        """
+        Renders the template returned by loadCustomTemplate with pyramid's renderer, which compiles every template
+        file once and adds the system values (request, context, ...)
+        :param template_path:
+        :param values: dictionary with the template variables
+        :param request:
+        :return: html
+        """
+        return render(template_path, values, request=request)
+
     @staticmethod
     def loadCustomTemplate(request, directory_settings, template_src_settings, fallbackoption):
         # TODO: template_str is not used. refactor this or use it
@@ -46,11 +89,13 @@ class TemplateHandler:
 
 
     @staticmethod
-    def _apply_specific_templates(filenames, extension_specific, keypath=None):
+    def _apply_specific_templates(filenames, extension_specific, keypath=None, continued_groups=None):
         """
         Applies the specific templates which are set in the directory_settings to the list of files
         :param filenames:
         :param extension_specific:
+        :param continued_groups: set of group paths (tuples of the keys) which were already started on a previous
+        page, only their rows are rendered
         :return:
         """
         def apply_templates_to_leafnodes(tree, template_leafs):
@@ -99,11 +144,11 @@ class TemplateHandler:
             print('didnt match {0}'.format(specified_template))
 
         # load template and check if it comes from an old version
-        template = PageTemplate(extension_specific['template'], keep_body=True)
+        template = TemplateHandler.compiled_template(extension_specific['template'], keep_body=True)
         if re.search('grouped_files', template.body) is not None:
             log = logging.getLogger(__name__)
             log.warning('Using an old template ==> Not working since update')
-            template = PageTemplate('<div>Found an outdated template, while compiling <span tal:content="file"></span></div>'.format(template.body), keep_body=True)
+            template = TemplateHandler.compiled_template('<div>Found an outdated template, while compiling <span tal:content="file"></span></div>', keep_body=True)
         filedict_with_html = apply_templates_to_leafnodes(filenames, template)
 
         # compute the column width
@@ -118,9 +163,11 @@ class TemplateHandler:
 
         # "new" step we already applied the template to each individual element and now we format all elements globally
         return render('template/specific_key_template.pt',
-                      dict(grouped_files=filedict_with_html, columnwidth=column_width, groups=keypath))
+                      dict(grouped_files=filedict_with_html, columnwidth=column_width, groups=keypath,
+                           continued=continued_groups if continued_groups is not None else set()))
 
-    def apply_templates(self, dict_items, directory_settings, folder_descriptions=None, overwrite_key=None, keypath=[]):
+    def apply_templates(self, dict_items, directory_settings, folder_descriptions=None, overwrite_key=None, keypath=[],
+                        continued_groups=None):
         """
         Apply the template specified in the direcotry settings to all elements in the dict_items dictionary
         """
@@ -139,20 +186,22 @@ class TemplateHandler:
             if filter_criteria in special_filetemplates:
                 tmp_key = keypath + [filter_criteria, ]
                 extension_specific = special_filetemplates[filter_criteria]
-                html = self._apply_specific_templates(filenames, extension_specific, keypath=tmp_key)
+                html = self._apply_specific_templates(filenames, extension_specific, keypath=tmp_key,
+                                                     continued_groups=continued_groups)
                 dict_items[filter_criteria] = [html]
             elif overwrite_key is not None and overwrite_key in special_filetemplates:
                 tmp_key = keypath + [filter_criteria, ]
                 extension_specific = special_filetemplates[overwrite_key]
-                html = self._apply_specific_templates(filenames, extension_specific, keypath=tmp_key)
+                html = self._apply_specific_templates(filenames, extension_specific, keypath=tmp_key,
+                                                     continued_groups=continued_groups)
                 dict_items[filter_criteria] = [html]
             else:
                 # check for the template
                 template = None
                 if filter_criteria != '' and not filter_criteria == '..' and file_template is not None:
-                    template = PageTemplate(file_template)
+                    template = self.compiled_template(file_template)
                 elif filter_criteria == '' and folder_template is not None:
-                    template = PageTemplate(folder_template)
+                    template = self.compiled_template(folder_template)
                 else:
                     logger.warning('Unknown filter_criteria "{0}"'.format(filter_criteria))
                 # apply elements to the template
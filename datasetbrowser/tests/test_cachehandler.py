@@ -0,0 +1,56 @@
+import unittest
+
+from datasetbrowser.requesthandler.cacheHandler import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_max_entries(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        # b is the least recently used entry
+        self.assertEqual([1, None, 3], [cache.get('a'), cache.get('b'), cache.get('c')])
+        self.assertEqual(0, cache.bytes)
+
+    def test_max_bytes(self):
+        cache = LRUCache(100, max_bytes=10)
+        cache.set('a', 'aaaa')
+        cache.set('b', 'bbbb')
+        self.assertEqual(8, cache.bytes)
+        cache.get('a')
+        cache.set('c', 'ccc')
+        # b is evicted, such that the total size fits into the budget again
+        self.assertEqual(['aaaa', None, 'ccc'], [cache.get('a'), cache.get('b'), cache.get('c')])
+        self.assertEqual(7, cache.bytes)
+
+    def test_replaced_value(self):
+        cache = LRUCache(100, max_bytes=10)
+        cache.set('a', 'aaaa')
+        cache.set('a', 'aaaaaaaa')
+        self.assertEqual(8, cache.bytes)
+        cache.remove('a')
+        self.assertEqual(0, cache.bytes)
+        self.assertEqual(0, len(cache))
+
+    def test_value_exceeding_the_budget(self):
+        cache = LRUCache(100, max_bytes=10)
+        cache.set('a', 'aaaa')
+        cache.set('b', 'b' * 11)
+        # the value isn't stored, and it doesn't evict the other entries
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual('aaaa', cache.get('a'))
+        self.assertEqual(4, cache.bytes)
+
+    def test_sizeof(self):
+        cache = LRUCache(100, max_bytes=100, sizeof=lambda value: value[1])
+        cache.set('a', ('small', 40))
+        cache.set('b', ('large', 70))
+        self.assertFalse('a' in cache)
+        self.assertTrue('b' in cache)
+        self.assertEqual(70, cache.bytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from datasetbrowser.requesthandler.diskCache import DiskCache
+from datasetbrowser.requesthandler.csvColumnStore import CSVColumnStore
+from datasetbrowser.requesthandler.csvHandler import CSVHandler
+
+
+class CSVColumnStoreTest(unittest.TestCase):
+    content = b'id,score,name\n' + b''.join([
+        b'0,3.5,a\n', b'1,,b\n', b'2,-1,c\n', b'3,7,d\n', b'4,nan,e\n', b'5,3.5,f\n', b'6,0,g\n'])
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'table.csv')
+        with open(self.path, 'wb') as f:
+            f.write(self.content)
+        os.mkdir(os.path.join(self.directory, 'cache'))
+        self.column_store = CSVColumnStore(DiskCache(os.path.join(self.directory, 'cache'), 1024 ** 2, '.npy'))
+        self.profile = CSVHandler.profile(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def select(self, **parameters):
+        selection = self.column_store.select(self.path, self.profile, **parameters)
+        return list(selection) if selection is not None else None
+
+    def test_numeric_columns(self):
+        self.assertEqual([0, 1], CSVColumnStore.numeric_columns(self.profile))
+        self.assertIsNone(self.column_store.column(self.path, self.profile, 2))
+        self.assertEqual(7, len(self.column_store.column(self.path, self.profile, 1)))
+
+    def test_sort(self):
+        # equal values keep the order of the file, nan values are last
+        self.assertEqual([2, 6, 0, 5, 3, 1, 4], self.select(sort=1))
+
+    def test_sort_descending(self):
+        # nan values are last in descending order as well, equal values are in reversed order of the file
+        self.assertEqual([3, 5, 0, 6, 2, 1, 4], self.select(sort=1, descending=True))
+        self.assertEqual([6, 5, 4, 3, 2, 1, 0], self.select(sort=0, descending=True))
+
+    def test_filter(self):
+        self.assertEqual([0, 5, 6], self.select(filter_column=1, minimum=0, maximum=5))
+        self.assertEqual([0, 2, 3, 5, 6], self.select(filter_column=1))
+        self.assertEqual([3, 5, 0], self.select(sort=1, descending=True, filter_column=1, minimum=1))
+
+    def test_invalid_selection(self):
+        self.assertIsNone(self.select())
+        self.assertIsNone(self.select(sort=2))
+        self.assertIsNone(self.select(filter_column=2, minimum=0))
+
+    def test_columns_too_large_for_the_cache(self):
+        self.column_store = CSVColumnStore(DiskCache(os.path.join(self.directory, 'cache'), 64, '.npy'))
+        self.assertEqual([2, 6, 0, 5, 3, 1, 4], self.select(sort=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
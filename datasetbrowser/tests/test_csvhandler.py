@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from datasetbrowser.requesthandler.csvHandler import CSVHandler
+
+
+class CSVStatisticsTest(unittest.TestCase):
+    content = b'id;value;name\n' + b''.join([
+        b'1;0.5;a\n', b'2;;b\n', b'3;1.5;c\n', b'4;nan;d\n', b'5;4;e\n', b'6;2;f\n', b'7;3.5;g\n'])
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'table.csv')
+        with open(self.path, 'wb') as f:
+            f.write(self.content)
+        self._statistics_chunk_rows = CSVHandler.statistics_chunk_rows
+
+    def tearDown(self):
+        CSVHandler.statistics_chunk_rows = self._statistics_chunk_rows
+        shutil.rmtree(self.directory)
+
+    def test_profile(self):
+        profile = CSVHandler.profile(self.path)
+        self.assertEqual(';', profile['delimiter'])
+        self.assertTrue(profile['has_header'])
+        self.assertEqual(['id', 'value', 'name'], profile['header'])
+        self.assertEqual('text', profile['types'][2])
+
+    def test_statistics(self):
+        # chunks smaller than the file, thus the statistics are combined from several chunks
+        CSVHandler.statistics_chunk_rows = 3
+        profile = CSVHandler.profile(self.path)
+        statistics = CSVHandler.statistics(self.path, profile, bins=4)
+        self.assertEqual(7, statistics['rows'])
+        identifiers, values, names = statistics['columns']
+        self.assertEqual(dict(count=7, nan=0, min=1.0, max=7.0, mean=4.0), dict(
+            [(key, identifiers[key]) for key in ('count', 'nan', 'min', 'max', 'mean')]))
+        self.assertEqual(dict(count=5, nan=2, min=0.5, max=4.0, mean=2.3), dict(
+            [(key, values[key]) for key in ('count', 'nan', 'min', 'max', 'mean')]))
+        self.assertEqual([0.5, 1.375, 2.25, 3.125, 4.0], values['histogram']['edges'])
+        self.assertEqual([1, 2, 0, 2], values['histogram']['counts'])
+        self.assertEqual('name', names['name'])
+        self.assertNotIn('count', names)
+
+    def test_prepare_statistics(self):
+        profile = CSVHandler.profile(self.path)
+        self.assertIsNone(CSVHandler.cached_statistics(self.path, profile, 3))
+        self.assertTrue(CSVHandler.prepare_statistics(self.path, profile, 3))
+        for i in range(100):
+            if CSVHandler.cached_statistics(self.path, profile, 3) is not None:
+                break
+            time.sleep(0.05)
+        statistics = CSVHandler.cached_statistics(self.path, profile, 3)
+        self.assertEqual(CSVHandler.statistics(self.path, profile, 3), statistics)
+        self.assertEqual(3, len(statistics['columns'][0]['histogram']['counts']))
+
+
+if __name__ == '__main__':
+    unittest.main()
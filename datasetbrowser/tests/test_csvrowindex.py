@@ -0,0 +1,83 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from datasetbrowser.requesthandler.diskCache import DiskCache
+from datasetbrowser.requesthandler.csvRowIndex import CSVRowIndex
+
+
+class CSVRowIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.row_index = CSVRowIndex(DiskCache(self.directory, 1024 ** 2, '.npy'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, content):
+        path = os.path.join(self.directory, 'table.csv')
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def assert_rows(self, content, chunk_size=CSVRowIndex.chunk_size):
+        """
+        Checks that the rows spanned by the offsets are the rows of csv.reader
+        """
+        row_index = CSVRowIndex(DiskCache(tempfile.mkdtemp(dir=self.directory), 1024 ** 2, '.npy'))
+        row_index.chunk_size = chunk_size
+        offsets = row_index.offsets(self.write(content))
+        self.assertEqual(0, offsets[0])
+        self.assertEqual(len(content), offsets[-1])
+        rows = [list(csv.reader(io.BytesIO(content[offsets[i]:offsets[i + 1]])))
+                for i in range(len(offsets) - 1)]
+        self.assertTrue(all([len(row) == 1 for row in rows]))
+        self.assertEqual(list(csv.reader(io.BytesIO(content))), [row[0] for row in rows])
+
+    def test_rows(self):
+        self.assert_rows(b'a,b\n1,2\n3,4\n')
+
+    def test_quoted_newlines(self):
+        self.assert_rows(b'name,comment\n1,"first\nsecond"\n2,"say ""hi""\nthere"\n3,plain\n')
+
+    def test_without_trailing_newline(self):
+        self.assert_rows(b'a,b\n1,2\n3,4')
+
+    def test_stray_quotes(self):
+        # quote characters within unquoted fields don't open a quoted field
+        self.assert_rows(b'name,size\nfloppy,5" disk\nhard disk,3.5"\ncd,12 cm\n"quoted\nname",1\n')
+        self.assert_rows(b'a,b\n"x"y"z,1\n2,3\n')
+        content = b''.join([b'1,"quoted\n,value",x\n' if i % 3 == 0 else b'22,3" 4,44\n' for i in range(50)])
+        for chunk_size in (1, 2, 3, 7, 16):
+            self.assert_rows(content, chunk_size)
+
+    def test_quotechar(self):
+        path = self.write(b"id;note\n1;'a\nb'\n2;c\n")
+        self.assertEqual([0, 8, 16, 20], list(self.row_index.offsets(path, quotechar="'", delimiter=';')))
+        self.assertEqual([0, 8, 13, 16, 20], list(self.row_index.offsets(path)))
+
+    def test_empty_file(self):
+        offsets = self.row_index.offsets(self.write(b''))
+        self.assertEqual([0], list(offsets))
+
+    def test_chunk_boundaries(self):
+        content = b''.join([b'1,"quoted\n,value",x\n' if i % 3 == 0 else b'22,33,44\n' for i in range(50)])
+        for chunk_size in (1, 2, 3, 7, 16):
+            self.assert_rows(content, chunk_size)
+
+    def test_cached(self):
+        path = self.write(b'a,b\n1,2\n')
+        self.assertIsNone(self.row_index.offsets(path, build=False))
+        self.assertEqual([0, 4, 8], list(self.row_index.offsets(path)))
+        self.assertEqual([0, 4, 8], list(self.row_index.offsets(path, build=False)))
+
+    def test_index_too_large_for_the_cache(self):
+        self.row_index = CSVRowIndex(DiskCache(self.directory, 16, '.npy'))
+        self.assertEqual([0, 4, 8], list(self.row_index.offsets(self.write(b'a,b\n1,2\n'))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from datasetbrowser.requesthandler.diskCache import DiskCache
+
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.written = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writer(self, content):
+        def write(path):
+            self.written.append(content)
+            with open(path, 'wb') as f:
+                f.write(content)
+        return write
+
+    def test_build(self):
+        cache = DiskCache(self.directory, 1024)
+        path, temporary = cache.build('a', self.writer(b'first'))
+        self.assertFalse(temporary)
+        self.assertEqual(path, cache.get('a'))
+        # the cached file is reused
+        self.assertEqual((path, False), cache.build('a', self.writer(b'second')))
+        self.assertEqual([b'first'], self.written)
+        with open(path, 'rb') as f:
+            self.assertEqual(b'first', f.read())
+
+    def test_file_exceeding_the_budget(self):
+        cache = DiskCache(self.directory, 4)
+        path, temporary = cache.build('a', self.writer(b'too large'))
+        self.assertTrue(temporary)
+        self.assertTrue(os.path.exists(path))
+        self.assertIsNone(cache.get('a'))
+
+    def test_failed_build(self):
+        cache = DiskCache(self.directory, 1024)
+
+        def write(path):
+            raise IOError('disk full')
+        self.assertRaises(IOError, cache.build, 'a', write)
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_evict(self):
+        cache = DiskCache(self.directory, 10)
+        cache.build('a', self.writer(b'aaaa'))
+        cache.build('b', self.writer(b'bbbb'))
+        os.utime(cache.get('b'), (0, 0))
+        cache.build('c', self.writer(b'cccc'))
+        # b is the least recently used file
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import random
+import unittest
+
+import numpy
+from Levenshtein._levenshtein import distance
+
+from datasetbrowser.requesthandler.itemgrouper import ItemGrouper
+
+MAXINT = 2 ** 62
+
+
+def _baseline_edit_distance_matrix(input):
+    """
+    Frozen copy of the former ItemGrouper._compute_edit_distance_matrix
+    """
+    matrix = numpy.zeros(shape=(len(input), len(input)))
+    for i, item_a in enumerate(input):
+        for j, item_b in enumerate(input):
+            if i == j:
+                matrix[i, j] = MAXINT - 1000
+            else:
+                matrix[i, j] = distance(item_a, item_b)
+    return matrix
+
+
+def _baseline_group_by_matrix(input, matrix, items_per_row):
+    """
+    Frozen copy of the former ItemGrouper._group_by_matrix, which rescanned the whole matrix for every pair
+    """
+    rows = []
+    tmp_row = []
+    minvalue = matrix.min()
+    elements_to_add = len(input)
+    while minvalue != MAXINT:
+        index = numpy.unravel_index(matrix.argmin(), matrix.shape)
+        elements = [input[index[0]], input[index[1]]]
+
+        for element in elements:
+            tmp_row.append(element)
+            elements_to_add -= 1
+            if len(tmp_row) == items_per_row:
+                rows.append(tmp_row)
+                tmp_row = []
+            if elements_to_add == 0 and len(tmp_row) > 0:
+                rows.append(tmp_row)
+                tmp_row = []
+
+        matrix[index] = MAXINT
+        matrix[index[1], index[0]] = MAXINT
+
+        if len(tmp_row) == 0:
+            matrix[index[0], :] = MAXINT
+            matrix[index[1], :] = MAXINT
+            matrix[:, index[0]] = MAXINT
+            matrix[:, index[1]] = MAXINT
+        minvalue = matrix.min()
+    return rows
+
+
+class GroupByDistancesTest(unittest.TestCase):
+    def assert_same_grouping(self, items, items_per_row):
+        grouper = ItemGrouper()
+        expected = _baseline_group_by_matrix(items, _baseline_edit_distance_matrix(items), items_per_row)
+        grouped = grouper._group_by_distances(items, ItemGrouper._compute_edit_distances(items), items_per_row)
+        self.assertEqual(expected, grouped, 'items {0}, items_per_row {1}'.format(items, items_per_row))
+
+    def test_single_item(self):
+        for items_per_row in (1, 2, 3):
+            self.assert_same_grouping(['run_1.png'], items_per_row)
+
+    def test_equal_names(self):
+        for items_per_row in (1, 2, 3, 4):
+            self.assert_same_grouping(['plot.png'] * 5, items_per_row)
+
+    def test_ties(self):
+        # all names differ in a single character, thus every pair has the same distance
+        items = ['run_{0}.png'.format(c) for c in 'abcdefg']
+        for items_per_row in (1, 2, 3, 5):
+            self.assert_same_grouping(items, items_per_row)
+
+    def test_experiment_names(self):
+        items = ['run_{0}_{1}.png'.format(run, metric) for run in range(1, 13) for metric in ('loss', 'acc')]
+        for items_per_row in (2, 3, 4):
+            self.assert_same_grouping(items, items_per_row)
+
+    def test_random_names(self):
+        generator = random.Random(1234)
+        for case in range(100):
+            items = [''.join(generator.choice('ab_0123') for k in range(generator.randint(1, 6)))
+                     for i in range(generator.randint(1, 14))]
+            self.assert_same_grouping(items, generator.randint(1, 5))
+
+    def test_small_blocks(self):
+        # the pairs of one distance are spread over several blocks
+        distance_block_size = ItemGrouper.distance_block_size
+        ItemGrouper.distance_block_size = 5
+        try:
+            self.test_experiment_names()
+            self.test_ties()
+        finally:
+            ItemGrouper.distance_block_size = distance_block_size
+
+
+class PaginateTest(unittest.TestCase):
+    tree = {'run_b': {'loss': [['b1', 'b2'], ['b3']], 'acc': [['b4']]}, 'run_a': [['a1', 'a2'], ['a3', 'a4']]}
+
+    def test_pages(self):
+        grouper = ItemGrouper()
+        page, total_rows = grouper.paginate(self.tree, 1, 2)
+        self.assertEqual(5, total_rows)
+        self.assertEqual({'run_a': [['a3', 'a4']], 'run_b': {'acc': [['b4']]}}, page)
+        self.assertEqual({}, grouper.paginate(self.tree, 5, 2)[0])
+
+    def test_first_group(self):
+        grouper = ItemGrouper()
+        self.assertEqual(['run_a'], grouper.first_group(self.tree))
+        self.assertEqual(['run_b', 'loss'], grouper.first_group(grouper.paginate(self.tree, 3, 1)[0]))
+        self.assertEqual([], grouper.first_group({}))
+
+
+class ApproximateGroupingTest(unittest.TestCase):
+    def setUp(self):
+        self._parallel_threshold = ItemGrouper.parallel_threshold
+
+    def tearDown(self):
+        ItemGrouper.parallel_threshold = self._parallel_threshold
+
+    def test_buckets_larger_than_parallel_threshold(self):
+        # the buckets are grouped by the worker pool, they must not start a pool inside the workers
+        ItemGrouper.parallel_threshold = 8
+        items = ['run_{0}_{1}.png'.format(run, metric) for run in range(30) for metric in ('loss', 'acc')]
+        rows = ItemGrouper()._approximate_grouping(items, 2, 20)
+        self.assertEqual(sorted(items), sorted([item for row in rows for item in row]))
+        self.assertTrue(all([len(row) <= 2 for row in rows]))
+
+
+if __name__ == '__main__':
+    unittest.main()
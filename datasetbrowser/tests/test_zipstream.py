@@ -0,0 +1,63 @@
+import io
+import os
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+import zipfile
+
+from datasetbrowser.requesthandler.zipStream import ZipStream, ZIP_DEFLATED, ZIP_STORED
+
+
+class ZipStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        generator = random.Random(42)
+        self.contents = {
+            'notes.txt': b'loss decreases\n' * 5000,
+            'plot.png': bytes(bytearray(generator.randint(0, 255) for i in range(300 * 1024))),
+            'empty.dat': b'',
+            'sub/values.csv': b'a;b\n1;2\n' * 1000,
+        }
+        self.members = []
+        for name, content in sorted(self.contents.items()):
+            path = os.path.join(self.directory, name.replace('/', os.sep))
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as f:
+                f.write(content)
+            self.members.append((path, name))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def archive(self, compression_level):
+        stream = ZipStream(self.members + [(os.path.join(self.directory, 'missing'), 'missing')], compression_level)
+        stream.chunk_size = 64 * 1024
+        return b''.join(stream)
+
+    def assert_archive(self, data, compress_types):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(sorted(self.contents.keys()), sorted(archive.namelist()))
+            for info in archive.infolist():
+                self.assertEqual(self.contents[info.filename], archive.read(info.filename))
+                self.assertEqual(compress_types[info.filename], info.compress_type)
+                # every member is followed by a data descriptor containing its crc and sizes
+                header = struct.unpack('<4sHHHHHLLLHH', data[info.header_offset:info.header_offset + 30])
+                self.assertEqual(0x08, header[2] & 0x08)
+                descriptor_offset = info.header_offset + 30 + header[9] + header[10] + info.compress_size
+                self.assertEqual((b'PK\x07\x08', info.CRC, info.compress_size, info.file_size), struct.unpack(
+                    '<4sLLL', data[descriptor_offset:descriptor_offset + 16]))
+
+    def test_deflated_and_stored_members(self):
+        self.assert_archive(self.archive(6), {'notes.txt': ZIP_DEFLATED, 'plot.png': ZIP_STORED,
+                                              'empty.dat': ZIP_STORED, 'sub/values.csv': ZIP_DEFLATED})
+
+    def test_stored_archive(self):
+        self.assert_archive(self.archive(0), dict((name, ZIP_STORED) for name in self.contents.keys()))
+
+
+if __name__ == '__main__':
+    unittest.main()
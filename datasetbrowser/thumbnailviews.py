@@ -0,0 +1,34 @@
+import os
+
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.response import FileResponse
+from pyramid.view import view_config
+
+from datasetbrowser.requesthandler.thumbnailHandler import ThumbnailHandler
+
+
+class ThumbnailViews:
+    def __init__(self, request):
+        self.request = request
+
+    @view_config(route_name='thumbnail', permission='authenticatedusers')
+    def thumbnail(self):
+        try:
+            size = int(self.request.matchdict['size'])
+        except ValueError:
+            raise HTTPNotFound()
+        if size < ThumbnailHandler.min_size or size > ThumbnailHandler.max_size:
+            raise HTTPNotFound()
+
+        root_dir = os.path.abspath(self.request.registry.settings['root_dir'])
+        path = os.path.abspath(os.path.join(root_dir, *self.request.matchdict['subpath']))
+        if not path.startswith(os.path.join(root_dir, '')) or not ThumbnailHandler.supports(path):
+            raise HTTPNotFound()
+
+        thumbnail_path, key = self.request.registry.settings['thumbnails'].thumbnail(path, size)
+        if thumbnail_path is None:
+            raise HTTPNotFound()
+        response = FileResponse(thumbnail_path, request=self.request, content_type='image/png')
+        response.etag = key
+        response.conditional_response = True
+        return response
@@ -1,11 +1,16 @@
+import cgi
+import hashlib
 import logging
 import os
+import urllib
 
 import jsonpickle
+from datasetbrowser.requesthandler.contactSheetHandler import ContactSheetHandler
 from datasetbrowser.requesthandler.directoryExportHandlers import PresentationExportHandler, ReportExportHandler
+from datasetbrowser.requesthandler.directoryListing import DirectoryListing
 from datasetbrowser.requesthandler.directoryRequestHandler import DirectoryRequestHandler
 from datasetbrowser.requesthandler.directoryZipHandler import DirectoryZipHandler
-from pyramid.renderers import render
+from pyramid.httpexceptions import HTTPNotFound
 from pyramid.response import Response
 from pyramid.view import (
     view_config,
@@ -14,7 +19,7 @@ from pyramid.view import (
 from datasetbrowser.templateHandler import TemplateHandler
 from datasetbrowser.requesthandler.directorySettingsHandler import DirectoryLoadSettings, DirectoryCreateLocalSettings
 from datasetbrowser.requesthandler.itemgrouper import ItemGrouper
-from models import DBSession
+from datasetbrowser.requesthandler.thumbnailHandler import ThumbnailHandler
 from models.FileLabelModel import FileLabelModel
 
 
@@ -35,47 +40,116 @@ class DirectoryRequest:
             return None
         elif 'zipfile' in param_dict:
             return DirectoryZipHandler.handle_request(self.request, relative_path, directory_settings)
+        elif 'contactsheet' in param_dict:
+            return ContactSheetHandler.handle_request(self.request, relative_path, directory_settings)
         else:
             return None
 
-    def _get_custom_directory_description(self, subfolder=None):
+    @staticmethod
+    def _default_description():
+        return {'longdescription': '', 'shortdescription': ''}
+
+    def _get_custom_directory_description(self):
         relative_path = DirectoryRequestHandler.requestfolderpath(self.request)
-        if subfolder is None:
-            description_file = '{0}.description.json'.format(
-                relative_path if relative_path.endswith('/') else relative_path + '/')
-        else:
-            description_file = '{0}{1}/.description.json'.format(
-                relative_path if relative_path.endswith('/') else relative_path + '/', subfolder)
         try:
-            with open(description_file) as f:
-                str_file = f.read()
-                description = jsonpickle.decode(str_file)
+            description = self.request.registry.settings['description_store'].get(relative_path)
         except BaseException as e:
             print(str(e))
-            description = {'longdescription': '', 'shortdescription': ''}
-        return description
+            description = None
+        return description if description is not None else self._default_description()
 
     def _local_settings_file_exists(self):
         relative_path = DirectoryRequestHandler.requestfolderpath(self.request)
-        listing = os.listdir(relative_path)
-        return '.settings.json' in listing
+        return os.path.isfile(os.path.join(relative_path, '.settings.json'))
 
     def _retrieve_labels(self, folder,  filenames_displayed):
+        labels = FileLabelModel.newest_labels([folder + elem for elem in filenames_displayed])
         element_labels = dict()
         for elem in filenames_displayed:
-            qsm = folder  + elem
-            results = DBSession.query(FileLabelModel.label).filter(FileLabelModel.filename == qsm).all()
-            if len(results) > 0:
-                # only retrieve the newest entry
-                label = results[-1][0]
-                element_labels[elem] = dict(label=label)
+            if folder + elem in labels:
+                element_labels[elem] = dict(label=labels[folder + elem])
         return element_labels
 
+    def _page_fingerprint(self, grouping_fingerprint, template_paths):
+        template_mtimes = [os.path.getmtime(path) if os.path.isfile(path) else None for path in template_paths]
+        versions = (grouping_fingerprint, FileLabelModel.table_version(), template_mtimes)
+        return hashlib.sha1(repr(versions).encode('utf-8')).hexdigest()
+
+    def _group_folder(self, relative_path, listing, directory_settings, grouping_fingerprint):
+        """
+        Groups the folder content, the result is reused as long as the folder and its settings are unchanged.
+        The returned structure is shared between requests and must not be modified.
+        """
+        grouping_cache = self.request.registry.settings['directory_grouping_cache']
+        return ItemGrouper().cached_group_folder(grouping_cache, relative_path, listing, directory_settings,
+                                                 grouping_fingerprint)
+
+    def _render_specific_page(self, key, tree, page, directory_settings, folder_descriptions):
+        """
+        Applies the templates to one page of rows of the files grouped by a specific filetemplate. If further rows
+        exist, a placeholder which loads the next page is appended.
+        :param key: specific filetemplate key
+        :param tree: grouped files of this key
+        :param page: index of the page
+        :return: dictionary group -> [html]
+        """
+        extension_specific = directory_settings['specific_filetemplates'][key]
+        rows_per_page = DirectoryRequestHandler.rows_per_page(self.request, extension_specific)
+        itemgrouper = ItemGrouper()
+        # groups which already started on the previous page only get their further rows
+        continued_groups = set()
+        if rows_per_page > 0:
+            if page > 0:
+                previous_group = itemgrouper.first_group(itemgrouper.paginate(tree, page * rows_per_page - 1, 1)[0])
+                first_group = itemgrouper.first_group(itemgrouper.paginate(tree, page * rows_per_page, 1)[0])
+                for depth in range(1, len(previous_group) + 1):
+                    if previous_group[:depth] != first_group[:depth]:
+                        break
+                    continued_groups.add(tuple([key] + previous_group[:depth]))
+            tree, total_rows = itemgrouper.paginate(tree, page * rows_per_page, rows_per_page)
+        else:
+            tree, total_rows = itemgrouper.paginate(tree, 0)
+
+        # labels and thumbnails are only required for the files on this page
+        leaf_items = itemgrouper.leaf_items(tree)
+        element_labels = self._retrieve_labels(self.request.matchdict['dir'], leaf_items)
+        thumbnail_size = DirectoryRequestHandler.thumbnail_size(self.request, extension_specific)
+        if thumbnail_size > 0:
+            for elem in leaf_items:
+                thumbnail_url = ThumbnailHandler.thumbnail_url(self.request, self.request.matchdict['dir'] + elem,
+                                                               thumbnail_size)
+                if thumbnail_url is not None:
+                    element_labels.setdefault(elem, dict())['thumbnail'] = thumbnail_url
+            if extension_specific.get('contact_sheet', False):
+                # all images of the page are loaded with a single request of the contact sheet
+                sheet_url = ContactSheetHandler.sheet_url(key, page, thumbnail_size)
+                tiles, width, height = ContactSheetHandler.layout(tree, extension_specific.get('elements_per_row', 1),
+                                                                  thumbnail_size)
+                for tile in tiles:
+                    element_labels.setdefault(tile['filename'], dict())['sprite'] = \
+                        dict(url=sheet_url, x=tile['x'], y=tile['y'], size=thumbnail_size)
+        # could crash in one level cases
+        tree = itemgrouper.convert_leafs_to_dicts(tree, filespecific_updates=element_labels)
+
+        # apply specific to the items
+        # TODO: if there is a specific key template, iterate till 'filename' is found then apply specific template
+        # for the whole tree apply then the specific key template
+        html = TemplateHandler().apply_templates(tree, directory_settings, folder_descriptions,
+                                                 overwrite_key=key, keypath=[key], continued_groups=continued_groups)
+
+        if rows_per_page > 0 and (page + 1) * rows_per_page < total_rows and len(html) > 0:
+            query = urllib.urlencode(dict(fragment=key.encode('utf-8'), page=page + 1))
+            placeholder = '<div class="lazy-page" data-url="?{0}"></div>'.format(cgi.escape(query, quote=True))
+            last_group = sorted(html.keys())[-1]
+            html[last_group] = [''.join(html[last_group]) + placeholder]
+        return html
+
     @view_config(route_name='directory', permission='authenticatedusers', request_method='GET')
     def directory(self):
         # TODO: load the description files
         relative_path = DirectoryRequestHandler.requestfolderpath(self.request)
-        listing = os.listdir(relative_path)
+        entries = DirectoryListing.list(relative_path)
+        listing = DirectoryListing.names(entries)
         relative_path = str(os.path.abspath(relative_path)).encode('string-escape')
         relative_path = relative_path.decode('string-escape')
 
@@ -83,15 +157,32 @@ class DirectoryRequest:
         directory_settings = self.request.registry.settings['directory_settings']
         directory_settings = DirectoryLoadSettings.handle_request(self.request, relative_path, directory_settings)
 
-        # load custom description
-        description = self._get_custom_directory_description()
-
         # TODO: Check whether there is a more 'clean' way to handle these specific requests
         custom_response = self._custom_request_handler(relative_path, directory_settings)
         if custom_response is not None:
             return custom_response
 
-        visible_items_by_extension, vi, invitems = ItemGrouper().group_folder(listing, directory_settings)
+        custom_directory_template_path = TemplateHandler.loadCustomTemplate(self.request, directory_settings,
+                                                                            'directory_template_path',
+                                                                            'template/directory.pt')
+        custom_index_path = TemplateHandler.loadCustomTemplate(self.request, directory_settings, 'custom_index_path',
+                                                               'template/index.pt')
+
+        # serve the page from the cache if nothing in the folder changed since it was rendered
+        page_cache = self.request.registry.settings['directory_page_cache']
+        cache_key = (relative_path, self.request.query_string, self.request.authenticated_userid,
+                     self.request.application_url)
+        grouping_fingerprint = DirectoryRequestHandler.fingerprint(
+            entries, [DirectoryLoadSettings.settings_version(directory_settings)])
+        fingerprint = self._page_fingerprint(grouping_fingerprint,
+                                             [custom_directory_template_path, custom_index_path])
+        cached_page = page_cache.get(cache_key)
+        if cached_page is not None and cached_page[0] == fingerprint:
+            return Response(cached_page[1])
+
+        grouped_items, vi, invitems = self._group_folder(relative_path, listing, directory_settings,
+                                                         grouping_fingerprint)
+        visible_items_by_extension = dict(grouped_items)
 
         # get the folders and files
         folders = visible_items_by_extension[''] if '' in visible_items_by_extension else []
@@ -99,46 +190,54 @@ class DirectoryRequest:
         if '' in files:
             del files['']
 
-        # get labels
-        element_labels = self._retrieve_labels(self.request.matchdict['dir'], vi)
-
-        # get all folde descriptions
-        folder_descriptions = dict()
+        # get all folder descriptions
+        folder_descriptions = self.request.registry.settings['description_store'].descriptions(relative_path, folders)
         for f in folders:
-            folder_descriptions[f] = self._get_custom_directory_description(f)
-
-        if 'specific_filetemplates' in directory_settings:
-            for (key, value) in visible_items_by_extension.items():
-                if key not in directory_settings['specific_filetemplates']:
-                    continue
-                # could crash in one level cases
-                visible_items_by_extension[key] = ItemGrouper().convert_leafs_to_dicts(visible_items_by_extension[key], filespecific_updates=element_labels)
-
-                # apply specific to the items
-                # TODO: if there is a specific key template, iterate till 'filename' is found then apply specific template
-                # for the whole tree apply then the specific key template
-                key_path = [key]
-                visible_items_by_extension[key] = TemplateHandler().\
-                    apply_templates(visible_items_by_extension[key],
-                                    directory_settings, folder_descriptions,
-                                    overwrite_key=key, keypath=key_path)
+            if f not in folder_descriptions:
+                folder_descriptions[f] = self._default_description()
+
+        specific_filetemplates = directory_settings.get('specific_filetemplates', dict())
+        if 'fragment' in self.request.params:
+            # return the requested page of the rows of one specific filetemplate
+            key = self.request.params['fragment']
+            if key not in specific_filetemplates or key not in visible_items_by_extension:
+                return Response('')
+            try:
+                page = int(self.request.params.get('page', 0))
+            except ValueError:
+                raise HTTPNotFound()
+            if page < 0:
+                raise HTTPNotFound()
+            html = self._render_specific_page(key, visible_items_by_extension[key], page, directory_settings,
+                                              folder_descriptions)
+            fragment = ''.join([''.join(html[group]) for group in sorted(html.keys())])
+            page_cache.set(cache_key, (fingerprint, fragment))
+            return Response(fragment)
+
+        # load custom description
+        description = self._get_custom_directory_description()
+
+        for (key, value) in visible_items_by_extension.items():
+            if key not in specific_filetemplates:
+                continue
+            visible_items_by_extension[key] = self._render_specific_page(key, value, 0, directory_settings,
+                                                                         folder_descriptions)
 
-        custom_directory_template_path = TemplateHandler.loadCustomTemplate(self.request, directory_settings,
-                                                                            'directory_template_path',
-                                                                            'template/directory.pt')
         # send it to the general directory view
-        directory_entry = render(custom_directory_template_path, dict(dir=self.request.matchdict['dir'],
-                                                                      visible_items_by_extension=visible_items_by_extension,
-                                                                      description=description,
-                                                                      request=self.request))
+        directory_entry = TemplateHandler.render_template(custom_directory_template_path,
+                                                          dict(dir=self.request.matchdict['dir'],
+                                                               visible_items_by_extension=visible_items_by_extension,
+                                                               description=description,
+                                                               request=self.request),
+                                                          request=self.request)
 
-        custom_index_path = TemplateHandler.loadCustomTemplate(self.request, directory_settings, 'custom_index_path',
-                                                               'template/index.pt')
         localsettingsfileexists = '.settings.json' in invitems
         index_parameter = dict(request=self.request, html=directory_entry, folders=folders, files=files,
                                localsettingsfile=localsettingsfileexists,
                                logged_in=self.request.authenticated_userid)
-        return Response(render(custom_index_path, index_parameter))
+        page = TemplateHandler.render_template(custom_index_path, index_parameter, request=self.request)
+        page_cache.set(cache_key, (fingerprint, page))
+        return Response(page)
 
     @view_config(route_name='directory', permission='authenticatedusers', request_method='POST')
     def directory_config(self):
@@ -155,6 +254,7 @@ class DirectoryRequest:
                     # Always overwrite the old description file. Perhaps we should be less strict
                     with open(save_path, 'w') as json_file:
                         json_file.write(jsonpickle.encode(description_obj))
+                    self.request.registry.settings['description_store'].invalidate(relative_path)
                 except BaseException as e:
                     # TODO: how to handle this? somehow not so easy to set new get parameters for the new request
                     logger.warning('Error occured while saving the folder description: {0}'.format(str(e)))
@@ -1,8 +1,8 @@
 import datetime
 
-from sqlalchemy import DateTime, Column, Integer, String, Boolean
+from sqlalchemy import DateTime, Column, Integer, String, Boolean, func
 
-from models import Base
+from models import Base, DBSession
 
 
 class FileLabelModel(Base):
@@ -18,3 +18,25 @@ class FileLabelModel(Base):
     def __init__(self, filename, label):
         self.filename = filename
         self.label = label
+
+    @staticmethod
+    def newest_labels(filenames, chunk_size=500):
+        """
+        Retrieves the newest label of each file with a few chunked IN queries
+        :param filenames: list of filenames as stored in the database
+        :param chunk_size: maximal number of filenames per query (sqlite limits the number of variables)
+        :return: dictionary filename -> label, files without a label are omitted
+        """
+        labels = dict()
+        filenames = list(filenames)
+        for i in range(0, len(filenames), chunk_size):
+            results = DBSession.query(FileLabelModel.filename, FileLabelModel.label).filter(
+                FileLabelModel.filename.in_(filenames[i:i + chunk_size])).order_by(FileLabelModel.id).all()
+            for (filename, label) in results:
+                labels[filename] = label
+        return labels
+
+    @staticmethod
+    def table_version():
+        # labels are only appended, thus the newest id identifies the state of the table
+        return DBSession.query(func.max(FileLabelModel.id)).scalar()
@@ -19,11 +19,13 @@ requires = [
     'python-Levenshtein',
     'jsonpickle',
     'pdfkit',
-    'markdown'
+    'markdown',
+    'scandir; python_version < "3.5"'
 ]
 
 extra_requires = {
-    'matfiles_extractor': ['h5py', 'Cython']
+    'matfiles_extractor': ['h5py', 'Cython'],
+    'settings_watcher': ['watchdog']
 }
 
 